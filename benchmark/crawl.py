@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       crawl.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+'''Compares the recursive dictionary crawl with the Flattener plans.
+
+The fixtures are scaled up to real sized documents:
+
+    - es_nodes_stats.json:   /_nodes/stats of a 120 node cluster.
+    - rabbitmq_queues.json:  /api/queues of a broker with 1000 queues.
+
+The last measurement includes only a part of the metrics to show the
+effect of pruning.
+
+Usage:
+
+    $ python benchmark/crawl.py
+'''
+
+import copy
+import json
+import os
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from metricfactory.flatten import Flattener
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ROUNDS = 20
+
+
+def recursiveCrawl(dictionary, breadcrumbs=""):
+    '''The crawl Elasticsearch and RabbitMQ used before the Flattener.'''
+
+    for k, v in dictionary.iteritems():
+        b = "%s.%s" % (breadcrumbs, k)
+        if isinstance(v, dict):
+            for metric in recursiveCrawl(v, b):
+                yield metric
+        elif isinstance(v, list):
+            continue
+        elif isinstance(v, (int, long, float, complex)):
+            yield (b, v)
+
+
+def loadFixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return json.load(f)
+
+
+def esNodesStats(nodes=120):
+    '''Returns (breadcrumbs, dictionary) of each node in /_nodes/stats.'''
+
+    template = loadFixture("es_nodes_stats.json")["nodes"].values()[0]
+    documents = []
+    for number in xrange(nodes):
+        node = copy.deepcopy(template)
+        node["name"] = "es-node-%03d" % (number)
+        documents.append(("nodes.%s" % (node["name"]), node))
+    return documents
+
+
+def rabbitmqQueues(queues=1000):
+    '''Returns (breadcrumbs, dictionary) of each queue in /api/queues.'''
+
+    template = loadFixture("rabbitmq_queues.json")[0]
+    documents = []
+    for number in xrange(queues):
+        queue = copy.deepcopy(template)
+        queue["name"] = "queue.%04d" % (number)
+        documents.append(("%s.queue.%s" % (queue["vhost"], queue["name"]), queue))
+    return documents
+
+
+def timeCrawl(crawl, documents):
+    '''Returns the best time of ROUNDS crawls over documents and the metric count.'''
+
+    best = None
+    for i in xrange(ROUNDS):
+        start = default_timer()
+        count = 0
+        for (breadcrumbs, dictionary) in documents:
+            for metric in crawl(dictionary, breadcrumbs):
+                count += 1
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, count
+
+
+def main():
+    for (fixture, documents, include) in (("es_nodes_stats", esNodesStats(), ["*.jvm.*", "*.thread_pool.*", "*.indexing.*"]),
+                                          ("rabbitmq_queues", rabbitmqQueues(), ["*.message_stats.*", "*.messages*"])):
+        flattener = Flattener()
+        (recursive, count) = timeCrawl(recursiveCrawl, documents)
+        (planned, planned_count) = timeCrawl(flattener.flatten, documents)
+        if count != planned_count:
+            sys.stderr.write("%s: recursive crawl found %s metrics, Flattener %s.\n" % (fixture, count, planned_count))
+            sys.exit(1)
+
+        (compiled, compiled_count) = timeCrawl(lambda dictionary, breadcrumbs: Flattener().flatten(dictionary, breadcrumbs), documents)
+
+        print "%s: %s metrics" % (fixture, count)
+        print "  recursive crawl: %8.2f ms  %10.0f metrics/s" % (recursive * 1000, count / recursive)
+        print "  compiling plans: %8.2f ms  %10.0f metrics/s" % (compiled * 1000, count / compiled)
+        print "  using plans:     %8.2f ms  %10.0f metrics/s  %.2fx" % (planned * 1000, count / planned, recursive / planned)
+
+        pruning = Flattener(include=include)
+        (pruned, pruned_count) = timeCrawl(pruning.flatten, documents)
+        print "  pruned plans:    %8.2f ms  %10.0f metrics/s  %.2fx  (%s metrics kept)" % (pruned * 1000, count / pruned, recursive / pruned, pruned_count)
+
+if __name__ == '__main__':
+    main()
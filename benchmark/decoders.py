@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       decoders.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+
+'''Measures the decoders on recorded fixtures without any queues involved.
+
+The parsing function of each decoder is fed with:
+
+    - modgearman.txt:        Mod_Gearman spool lines.
+    - gmond.xdr:             gmond XDR packets, each one prefixed with its
+                             length as a 4 byte unsigned integer.
+    - impstats.txt:          Rsyslog impstats lines.
+    - es_nodes_stats.json:   /_nodes/stats scaled up to 20 nodes.
+    - rabbitmq_queues.json:  /api/queues scaled up to 100 queues.
+
+For each decoder the metrics/s, ns/metric and the memory blocks allocated
+per decoded metric are reported.  Allocations are measured with
+tracemalloc when available.  Without tracemalloc (Python 2) only the
+number of new containers tracked by the garbage collector (mostly the
+metric tuples) is reported as containers/metric, which leaves out strings,
+floats and other objects the collector does not track.
+
+The results can be stored as a baseline and later runs compared against
+it.  A comparison exits with 1 when a decoder got slower than the
+tolerance.
+
+Usage:
+
+    $ python benchmark/decoders.py
+    $ python benchmark/decoders.py --save baseline.json
+    $ python benchmark/decoders.py --compare baseline.json --tolerance 10
+'''
+
+import argparse
+import copy
+import gc
+import json
+import os
+import struct
+import sys
+from timeit import default_timer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from metricfactory.decode import ModGearman, Ganglia, Rsyslog, Elasticsearch, RabbitMQ
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+ROUNDS = 5
+DURATION = 0.2
+
+
+def readFixture(name):
+    with open(os.path.join(FIXTURES, name), "rb") as f:
+        return f.read()
+
+
+def readPackets(name):
+    '''Returns the length prefixed packets stored in fixture name.'''
+
+    data = readFixture(name)
+    packets = []
+    offset = 0
+    while offset < len(data):
+        length = struct.unpack_from(">I", data, offset)[0]
+        packets.append(data[offset + 4:offset + 4 + length])
+        offset += 4 + length
+    return packets
+
+
+def modgearman():
+    decoder = ModGearman("benchmark")
+    decoder.preHook()
+    lines = readFixture("modgearman.txt").splitlines()
+
+    def decode():
+        metrics = []
+        for line in lines:
+            metrics.extend(decoder.decodeMetrics(line))
+        return metrics
+    return decode
+
+
+def ganglia():
+    decoder = Ganglia("benchmark")
+    packets = readPackets("gmond.xdr")
+
+    def decode():
+        metrics = []
+        for packet in packets:
+            metric = decoder.parsePacket(packet)
+            if metric is not None:
+                metrics.append(metric)
+        return metrics
+    return decode
+
+
+def rsyslog():
+    decoder = Rsyslog("benchmark")
+    lines = readFixture("impstats.txt").splitlines()
+
+    def decode():
+        metrics = []
+        for line in lines:
+            metrics.extend(decoder.extractMetrics(line))
+        return metrics
+    return decode
+
+
+def elasticsearch(nodes=20):
+    decoder = Elasticsearch("benchmark")
+    document = json.loads(readFixture("es_nodes_stats.json"))
+    template = document["nodes"].values()[0]
+    document["nodes"] = {}
+    for number in xrange(nodes):
+        node = copy.deepcopy(template)
+        node["name"] = "es-node-%03d" % (number)
+        document["nodes"]["node%03d" % (number)] = node
+
+    def decode():
+        return list(decoder.extractMetrics(document))
+    return decode
+
+
+def rabbitmq(queues=100):
+    decoder = RabbitMQ("benchmark")
+    template = json.loads(readFixture("rabbitmq_queues.json"))[0]
+    document = []
+    for number in xrange(queues):
+        queue = copy.deepcopy(template)
+        queue["name"] = "queue.%04d" % (number)
+        document.append(queue)
+
+    def decode():
+        return list(decoder.extractMetrics(document))
+    return decode
+
+
+def measure(decode):
+    '''Returns the metrics/s, ns/metric and blocks/metric or containers/metric of decode.'''
+
+    count = len(decode())
+    loops = 1
+    while True:
+        start = default_timer()
+        for i in xrange(loops):
+            decode()
+        elapsed = default_timer() - start
+        if elapsed >= DURATION:
+            break
+        loops *= 2
+
+    best = elapsed
+    for i in xrange(ROUNDS - 1):
+        start = default_timer()
+        for i in xrange(loops):
+            decode()
+        best = min(best, default_timer() - start)
+    per_metric = best / (loops * count)
+
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        metrics = decode()
+        allocations = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        key = "blocks_per_metric"
+    else:
+        before = len(gc.get_objects())
+        metrics = decode()
+        allocations = len(gc.get_objects()) - before
+        key = "containers_per_metric"
+    del metrics
+
+    return {"metrics": count,
+            "metrics_per_second": 1 / per_metric,
+            "ns_per_metric": per_metric * 1000000000,
+            key: float(allocations) / count}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measures the decoders on recorded fixtures.")
+    parser.add_argument("--save", help="Stores the results as baseline in this file.")
+    parser.add_argument("--compare", help="Compares the results with the baseline stored in this file.")
+    parser.add_argument("--tolerance", type=float, default=10, help="The max slowdown in percent compared to the baseline.")
+    arguments = parser.parse_args()
+
+    if tracemalloc is None:
+        (allocations, key) = ("containers/metric", "containers_per_metric")
+    else:
+        (allocations, key) = ("blocks/metric", "blocks_per_metric")
+    baseline = {}
+    if arguments.compare:
+        with open(arguments.compare) as f:
+            baseline = json.load(f)
+
+    results = {}
+    slower = []
+    print "%-14s %8s %12s %10s %17s %9s" % ("decoder", "metrics", "metrics/s", "ns/metric", allocations, "change")
+    for (name, workload) in (("modgearman", modgearman), ("ganglia", ganglia), ("rsyslog", rsyslog),
+                             ("elasticsearch", elasticsearch), ("rabbitmq", rabbitmq)):
+        result = measure(workload())
+        results[name] = result
+        change = ""
+        if name in baseline:
+            percent = (result["metrics_per_second"] / baseline[name]["metrics_per_second"] - 1) * 100
+            change = "%+.1f%%" % (percent)
+            if percent < -arguments.tolerance:
+                slower.append(name)
+        print "%-14s %8d %12.0f %10.0f %17.1f %9s" % (name, result["metrics"], result["metrics_per_second"], result["ns_per_metric"], result[key], change)
+
+    if arguments.save:
+        with open(arguments.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if slower:
+        sys.stderr.write("Slower than the baseline by more than %s%%: %s\n" % (arguments.tolerance, ", ".join(slower)))
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       fuzz_ganglia.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+
+'''Compares the Ganglia decoder with an xdrlib based reference decoder.
+
+Random gmond packets are generated and most of them are mutated by
+flipping bytes, truncating them, appending garbage or corrupting a length.
+Each packet is decoded by both decoders.  Both should either fail or
+return the same hostname, metric name and value, or the same metadata.
+
+The reference decoder is the xdrlib implementation Ganglia used before
+the struct based one, except that unsupported formats raise instead of
+returning a packet without value.  Only the versions the reference
+supports (128, 132, 133 and 134) are compared, other packets are counted
+as skipped.
+
+Usage:
+
+    $ python benchmark/fuzz_ganglia.py
+    $ python benchmark/fuzz_ganglia.py --packets 200000 --seed 1
+'''
+
+import argparse
+import os
+import random
+import struct
+import sys
+import xdrlib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from metricfactory.decode import Ganglia
+
+FORMATS = ["%f", "%.2f", "%u", "%d", "%s", "%x", ""]
+VERSIONS = (128, 132, 133, 134)
+
+
+def referenceDecode(data):
+    '''Decodes data the way the xdrlib based decoder did.'''
+
+    unpacker = xdrlib.Unpacker(data)
+    version = unpacker.unpack_int()
+    if version == 128:
+        meta = {"version": version,
+                "hostname": unpacker.unpack_string(),
+                "metric_name": unpacker.unpack_string(),
+                "spoofed_hostname": bool(unpacker.unpack_int()),
+                "metric_type": unpacker.unpack_string(),
+                "metric_name2": unpacker.unpack_string(),
+                "units": unpacker.unpack_string(),
+                "slope": unpacker.unpack_int(),
+                "tmax": unpacker.unpack_int(),
+                "dmax": unpacker.unpack_int(),
+                "metrics": {}
+                }
+        for i in xrange(unpacker.unpack_int()):
+            key = unpacker.unpack_string()
+            meta["metrics"][key] = unpacker.unpack_string()
+        unpacker.done()
+        return ("meta", meta)
+    elif version in (132, 133, 134):
+        hostname = unpacker.unpack_string()
+        metric_name = unpacker.unpack_string()
+        unpacker.unpack_int()
+        format = unpacker.unpack_string()
+        if format.endswith('f'):
+            value = unpacker.unpack_float()
+        elif format.endswith('u') or format.endswith('d'):
+            value = unpacker.unpack_int()
+        elif format.endswith('s'):
+            value = unpacker.unpack_string()
+        else:
+            raise Exception("Unsupported format %s." % (format))
+        unpacker.done()
+        return ("value", hostname, metric_name, repr(value))
+    else:
+        raise Exception("Unknown version number: %s" % version)
+
+
+def decode(decoder, data):
+    '''Decodes data with the Ganglia decoder into the reference format.'''
+
+    version = struct.unpack_from(">i", data)[0]
+    if version == 128:
+        (meta, offset) = decoder.doMetaPacket(data, 4, version)
+        if offset != len(data):
+            raise Exception("Packet length mismatch.")
+        return ("meta", meta)
+    metric = decoder.parsePacket(data)
+    return ("value", metric[2], metric[3], repr(metric[4]))
+
+
+def packString(generator, value=None):
+    if value is None:
+        value = "".join(chr(generator.randint(32, 126)) for i in xrange(generator.randint(0, 40)))
+    packer = xdrlib.Packer()
+    packer.pack_string(value)
+    return packer.get_buffer()
+
+
+def generatePacket(generator):
+    '''Returns a random valid metadata or value packet.'''
+
+    version = generator.choice(VERSIONS)
+    packet = struct.pack(">i", version) + packString(generator) + packString(generator) + struct.pack(">i", generator.randint(0, 1))
+    if version == 128:
+        packet += packString(generator) + packString(generator) + packString(generator)
+        packet += struct.pack(">iii", generator.randint(0, 4), generator.randint(0, 3600), generator.randint(0, 3600))
+        keys = generator.randint(0, 3)
+        packet += struct.pack(">i", keys)
+        for i in xrange(keys):
+            packet += packString(generator, "key%s" % (i)) + packString(generator)
+        return packet
+
+    format = generator.choice(FORMATS)
+    packet += packString(generator, format)
+    if format.endswith("f"):
+        packet += struct.pack(">f", generator.uniform(-1e6, 1e6))
+    elif format.endswith("u") or format.endswith("d"):
+        packet += struct.pack(">i", generator.randint(-2 ** 31, 2 ** 31 - 1))
+    else:
+        packet += packString(generator)
+    return packet
+
+
+def mutatePacket(generator, packet):
+    '''Returns packet with a random corruption or unchanged.'''
+
+    mutation = generator.randint(0, 4)
+    if mutation == 1 and packet:
+        position = generator.randrange(len(packet))
+        packet = packet[:position] + chr(generator.randint(0, 255)) + packet[position + 1:]
+    elif mutation == 2:
+        packet = packet[:generator.randrange(len(packet) + 1)]
+    elif mutation == 3:
+        packet += "".join(chr(generator.randint(0, 255)) for i in xrange(generator.randint(1, 8)))
+    elif mutation == 4 and len(packet) >= 8:
+        position = generator.randrange(4, len(packet) - 3) & ~3
+        packet = packet[:position] + struct.pack(">I", generator.randint(0, 2 ** 32 - 1)) + packet[position + 4:]
+    return packet
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compares the Ganglia decoder with an xdrlib reference decoder.")
+    parser.add_argument("--packets", type=int, default=20000, help="The number of packets to generate.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed of the random generator.")
+    arguments = parser.parse_args()
+
+    generator = random.Random(arguments.seed)
+    decoder = Ganglia("fuzz", meta=False)
+    (compared, skipped, mismatches) = (0, 0, 0)
+    for i in xrange(arguments.packets):
+        packet = mutatePacket(generator, generatePacket(generator))
+        if len(packet) < 4 or struct.unpack_from(">i", packet)[0] not in VERSIONS:
+            skipped += 1
+            continue
+        compared += 1
+        try:
+            expected = referenceDecode(packet)
+        except Exception:
+            expected = None
+        try:
+            result = decode(decoder, packet)
+        except Exception:
+            result = None
+        if result != expected:
+            mismatches += 1
+            if mismatches <= 10:
+                sys.stderr.write("Mismatch for %r:\n  reference: %r\n  decoder:   %r\n" % (packet, expected, result))
+
+    print "compared %s packets, skipped %s, %s mismatches" % (compared, skipped, mismatches)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -23,6 +23,7 @@
 #
 
 from wishbone import Actor
+from metricfactory.flatten import Flattener
 from gevent import monkey
 monkey.patch_time()
 from time import time
@@ -64,6 +65,29 @@ class Elasticsearch(Actor):
         - indices(list)([])
            |  The indices to include when polling /_stats
 
+        - paths(list)([])
+           |  Glob patterns of the metric names to include.  Patterns
+           |  starting with "!" exclude metrics instead.  For example:
+           |    ["nodes.*.jvm.*", "nodes.*.thread_pool.*", "!*.fielddata.*"]
+           |  Parts of the documents which can't contain any included
+           |  metric aren't crawled.  An empty list or a list with only
+           |  exclude patterns includes all other metrics.
+
+        - lists(str)("skip")
+           |  How to deal with lists:
+           |    "skip": ignore them.
+           |    "index": use the position of the items as metric name.
+
+        - strings(bool)(False)
+           |  When True, strings containing a number are converted to
+           |  numbers.
+
+        - plans(int)(10000)
+           |  The max number of crawl plans to keep.  One plan is kept per
+           |  node (nodes.<name>), per polled index, for indices._shards and
+           |  indices._all and for the cluster.indices, cluster.nodes and
+           |  cluster.health sections.
+
 
     Queues:
 
@@ -72,13 +96,16 @@ class Elasticsearch(Actor):
         - outbox:   Outgoing events.
     '''
 
-    def __init__(self, name, size=100, frequency=1, source="elasticsearch", indices=[]):
+    def __init__(self, name, size=100, frequency=1, source="elasticsearch", indices=[], paths=[], lists="skip", strings=False, plans=10000):
         Actor.__init__(self, name, size, frequency)
         self.pool.createQueue("inbox")
         self.pool.createQueue("outbox")
         self.registerConsumer(self.consume, "inbox")
         self.logging.info("Initialized")
         self.source = source
+        include = [path for path in paths if not path.startswith("!")]
+        exclude = [path[1:] for path in paths if path.startswith("!")]
+        self.flattener = Flattener(plans=plans, lists=lists, include=include, exclude=exclude, strings=strings)
         self.indices = indices
 
     def consume(self, event):
@@ -97,17 +124,10 @@ class Elasticsearch(Actor):
     def __formatMetric(self, timestamp, name, value):
         return (timestamp, "elasticsearch", self.source, name, value, '', ())
 
-    def __crawlDictionary(self, timestamp, dictionary,  breadcrumbs=""):
+    def __crawlDictionary(self, timestamp, dictionary, breadcrumbs=""):
 
-        for k, v in dictionary.iteritems():
-            b = "%s.%s" % (breadcrumbs, k)
-            if isinstance(v, dict):
-                for metric in self.__crawlDictionary(timestamp, v, b):
-                    yield metric
-            elif isinstance(v, list):
-                continue
-            elif isinstance(v, (int, long, float, complex)):
-                yield self.__formatMetric(timestamp, b, v)
+        for (name, value) in self.flattener.flatten(dictionary, breadcrumbs):
+            yield self.__formatMetric(timestamp, name, value)
 
     def extractMetrics(self, data):
         # (time, type, source, name, value, unit, (tag1, tag2))
@@ -124,7 +144,7 @@ class Elasticsearch(Actor):
                     for metric in self.__crawlDictionary(timestamp, data["indices"][index], index):
                         yield metric
                 except KeyError:
-                    self.logging.error("Index %s does not exist." % (metric))
+                    self.logging.error("Index %s does not exist." % (index))
         elif all(False for k in ["timestamp", "cluster_name", "status", "indices", "nodes"] if k not in data):
             # We have received metrics from /_cluster/stats
             for element in ["indices", "nodes"]:
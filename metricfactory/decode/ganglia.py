@@ -27,10 +27,16 @@
 # Patrick Debois https://gist.github.com/1376525
 
 from wishbone import Actor
-import xdrlib
+from metricfactory.metric import MetricBatch
+from struct import Struct, error as StructError
 from time import time
 from gevent.monkey import patch_time;patch_time()
 
+INT = Struct(">i")
+UINT = Struct(">I")
+FLOAT = Struct(">f")
+DOUBLE = Struct(">d")
+
 
 class DecodeGangliaException(Exception):
 
@@ -41,6 +47,32 @@ class DecodeGangliaException(Exception):
         return repr(self.value)
 
 
+def unpackInt(data, offset):
+    '''Returns the XDR int at offset and the offset of the next item.'''
+
+    return INT.unpack_from(data, offset)[0], offset + 4
+
+
+def unpackFloat(data, offset):
+    '''Returns the XDR float at offset and the offset of the next item.'''
+
+    return FLOAT.unpack_from(data, offset)[0], offset + 4
+
+
+def unpackDouble(data, offset):
+    '''Returns the XDR double at offset and the offset of the next item.'''
+
+    return DOUBLE.unpack_from(data, offset)[0], offset + 8
+
+
+def unpackString(data, offset):
+    '''Returns the XDR string at offset and the offset of the next item.'''
+
+    length = UINT.unpack_from(data, offset)[0]
+    offset += 4
+    return data[offset:offset + length], offset + ((length + 3) & ~3)
+
+
 class Ganglia(Actor):
 
     '''**Decode Ganglia metrics.**
@@ -50,6 +82,22 @@ class Ganglia(Actor):
 
     (1381002603.726132, 'hadoop', 'hostname', 'queue.outbox.in_rate', 0, '', ())
 
+    Metadata packets (version 128) are cached per hostname and metric name.
+    Value packets get the units of the cached metadata and the tags
+    ("type=<metric type>", "tmax=<tmax>").  A cached entry expires when no
+    value packet arrived for dmax seconds, unless dmax is 0.
+
+    The value of versions 132 (uint), 133 (string) and 134 (float) is
+    decoded according to the format of the packet, the value of versions
+    129 (ushort), 130 (short), 131 (int) and 135 (double) according to
+    the version.  Metadata requests (version 136) are ignored.
+
+    In bulk mode the data of an incoming event holds any number of XDR
+    messages, each one prefixed with its length as a 4 byte unsigned
+    big-endian integer, as submitted by the Gmond input module.  Messages
+    which can't be decoded are skipped.  The resulting metrics are
+    submitted as one event holding a list of metrics.
+
     Parameters:
 
         - name(str)
@@ -61,8 +109,21 @@ class Ganglia(Actor):
         - frequency(int)
            |  The frequency in seconds to generate metrics.
 
-        - meta(bool)(False)
-           |  When True, drops data with version 128.
+        - meta(bool)(True)
+           |  When True, caches metadata packets (version 128) to enrich
+           |  value packets.
+           |  When False, drops metadata packets.
+
+        - cache(int)(10000)
+           |  The max number of metadata packets to cache.
+
+        - bulk(bool)(False)
+           |  When True, incoming events contain length prefixed XDR
+           |  messages which are submitted as one list of metrics.
+
+        - compact(bool)(False)
+           |  When True, bulk mode submits a MetricBatch instead of a list
+           |  of metrics.
 
 
     Queues:
@@ -73,34 +134,66 @@ class Ganglia(Actor):
 
     '''
 
-    def __init__(self, name, size=100, frequency=1, meta=False):
+    def __init__(self, name, size=100, frequency=1, meta=True, cache=10000, bulk=False, compact=False):
         Actor.__init__(self, name, size, frequency)
         self.name = name
         self.meta = meta
+        self.cache = cache
+        self.bulk = bulk
+        self.compact = compact
+        self.__meta = {}
         self.pool.createQueue("inbox")
         self.pool.createQueue("outbox")
-        self.registerConsumer(self.consume, "inbox")
+        if bulk:
+            self.registerConsumer(self.consumeBulk, "inbox")
+        else:
+            self.registerConsumer(self.consume, "inbox")
 
     def parsePacket(self, data):
-        unpacker = xdrlib.Unpacker(data)
-        version = unpacker.unpack_int()
+        '''Decodes one XDR message.
+
+        Returns the metric or None in case of a metadata packet.
+        '''
+
+        try:
+            (metric, offset) = self.decodeMessage(data, 0)
+        except StructError:
+            raise DecodeGangliaException("Packet is truncated.")
+        if offset > len(data):
+            raise DecodeGangliaException("Packet is truncated.")
+        elif offset < len(data):
+            raise DecodeGangliaException("Unextracted data remains.")
+        return metric
 
-        if version in (132, 133, 134):
-            return self.doHeartBeatPacket(unpacker, version)
+    def decodeMessage(self, data, offset):
+        '''Decodes the XDR message starting at offset of data.
+
+        Returns the metric or None in case of a metadata packet and the
+        offset of the next message.
+        '''
+
+        (version, offset) = unpackInt(data, offset)
+
+        if 129 <= version <= 135:
+            return self.doHeartBeatPacket(data, offset, version)
         elif version == 128:
+            (meta, offset) = self.doMetaPacket(data, offset, version)
             if self.meta:
-                return self.doMetaPacket(unpacker, version)
-            else:
-                raise DecodeGangliaException("Version 128 is ignored.")
+                self.cacheMeta(meta)
+            return None, offset
+        elif version == 136:
+            (hostname, offset) = unpackString(data, offset)
+            (metric_name, offset) = unpackString(data, offset)
+            return None, offset + 4
         else:
             raise Exception("Unknown version number: %s" % version)
 
     def consume(self, event):
         try:
             data = self.parsePacket(event["data"])
-            event['data'] = (
-                time(), "ganglia", data["hostname"], data["metric_name"], data["value"], "", ())
-            self.submit(event, self.pool.queue.outbox)
+            if data is not None:
+                event['data'] = data
+                self.submit(event, self.pool.queue.outbox)
         except Exception as err:
             self.logging.debug("Failed to decode package. Reason: %s" % err)
             raise
@@ -108,45 +201,132 @@ class Ganglia(Actor):
             self.logging.debug(err)
             raise
 
-    def doMetaPacket(self, unpacker, version):
-        data = {"version": version,
-                "hostname": unpacker.unpack_string(),
-                "metric_name": unpacker.unpack_string(),
-                "spoofed_hostname": bool(unpacker.unpack_int()),
-                "metric_type": unpacker.unpack_string(),
-                "metric_name2": unpacker.unpack_string(),
-                "units": unpacker.unpack_string(),
-                "slope": unpacker.unpack_int(),
-                "tmax": unpacker.unpack_int(),
-                "dmax": unpacker.unpack_int(),
-                "metrics": {}
-                }
-        remaining = unpacker.unpack_int()
-        for i in range(remaining):
-            data["metrics"][
-                unpacker.unpack_string()] = unpacker.unpack_string()
-        unpacker.done()
-        if data is not None:
-            return data
+    def consumeBulk(self, event):
+        data = event["data"]
+        length = len(data)
+        offset = 0
+        skipped = 0
+        if self.compact:
+            metrics = MetricBatch()
         else:
-            raise Exception("Empty dataset")
-
-    def doHeartBeatPacket(self, unpacker, version):
-        data = {"version": version,
-                "hostname": unpacker.unpack_string(),
-                "metric_name": unpacker.unpack_string(),
-                "spoof": bool(unpacker.unpack_int()),
-                "format": unpacker.unpack_string()
-                }
-
-        if data["format"].endswith('f'):
-            data["value"] = unpacker.unpack_float()
-        elif data["format"].endswith('u') or data["format"].endswith('d'):
-            data["value"] = unpacker.unpack_int()
-        elif data["format"].endswith('s'):
-            data["value"] = unpacker.unpack_string()
-        unpacker.done()
-        if data is not None:
-            return data
+            metrics = []
+
+        while offset < length:
+            if offset + 4 > length:
+                self.logging.debug("Length prefix at offset %s is truncated." % (offset))
+                skipped += 1
+                break
+            size = UINT.unpack_from(data, offset)[0]
+            offset += 4
+            if offset + size > length:
+                self.logging.debug("Message at offset %s is truncated." % (offset))
+                skipped += 1
+                break
+            try:
+                metric = self.parsePacket(buffer(data, offset, size))
+            except Exception as err:
+                self.logging.debug("Skipped message at offset %s. Reason: %s" % (offset, err))
+                skipped += 1
+            else:
+                if metric is not None:
+                    metrics.append(metric)
+            offset += size
+
+        if skipped:
+            self.logging.warning("Skipped %s messages which failed to decode." % (skipped))
+        if metrics:
+            self.submit({"header": event["header"], "data": metrics}, self.pool.queue.outbox)
+
+    def cacheMeta(self, meta):
+        '''Stores the units and tags of a decoded metadata packet.'''
+
+        if meta["dmax"] > 0:
+            expires = time() + meta["dmax"]
         else:
-            raise Exception("Empty dataset")
+            expires = 0
+
+        key = (meta["hostname"], meta["metric_name"])
+        if key not in self.__meta and len(self.__meta) >= self.cache:
+            self.__meta.popitem()
+        self.__meta[key] = [meta["units"], ("type=%s" % (meta["metric_type"]), "tmax=%s" % (meta["tmax"])), meta["dmax"], expires]
+
+    def doMetaPacket(self, data, offset, version):
+        (hostname, offset) = unpackString(data, offset)
+        (metric_name, offset) = unpackString(data, offset)
+        (spoofed_hostname, offset) = unpackInt(data, offset)
+        (metric_type, offset) = unpackString(data, offset)
+        (metric_name2, offset) = unpackString(data, offset)
+        (units, offset) = unpackString(data, offset)
+        (slope, offset) = unpackInt(data, offset)
+        (tmax, offset) = unpackInt(data, offset)
+        (dmax, offset) = unpackInt(data, offset)
+        (remaining, offset) = unpackInt(data, offset)
+        metrics = {}
+        for i in xrange(remaining):
+            (key, offset) = unpackString(data, offset)
+            (metrics[key], offset) = unpackString(data, offset)
+
+        return {"version": version,
+                "hostname": hostname,
+                "metric_name": metric_name,
+                "spoofed_hostname": bool(spoofed_hostname),
+                "metric_type": metric_type,
+                "metric_name2": metric_name2,
+                "units": units,
+                "slope": slope,
+                "tmax": tmax,
+                "dmax": dmax,
+                "metrics": metrics
+                }, offset
+
+    def doHeartBeatPacket(self, data, offset, version):
+
+        # Inlined unpackString() calls since this is the hot path.  Strings
+        # running past the end of data are caught by the length check in
+        # parsePacket() or by the next unpack_from().
+        unpack = UINT.unpack_from
+
+        length = unpack(data, offset)[0]
+        offset += 4
+        hostname = data[offset:offset + length]
+        offset += (length + 3) & ~3
+
+        length = unpack(data, offset)[0]
+        offset += 4
+        metric_name = data[offset:offset + length]
+        offset += ((length + 3) & ~3) + 4
+
+        length = unpack(data, offset)[0]
+        offset += 4
+        format = data[offset:offset + length]
+        offset += (length + 3) & ~3
+
+        if version == 129:
+            (value, offset) = UINT.unpack_from(data, offset)[0], offset + 4
+        elif version in (130, 131):
+            (value, offset) = unpackInt(data, offset)
+        elif version == 135:
+            (value, offset) = unpackDouble(data, offset)
+        elif format.endswith('f'):
+            (value, offset) = unpackFloat(data, offset)
+        elif format.endswith('u') or format.endswith('d'):
+            (value, offset) = unpackInt(data, offset)
+        elif format.endswith('s'):
+            (value, offset) = unpackString(data, offset)
+        else:
+            raise DecodeGangliaException("Unsupported format %s." % (format))
+
+        now = time()
+        try:
+            entry = self.__meta[(hostname, metric_name)]
+        except KeyError:
+            return (now, "ganglia", hostname, metric_name, value, "", ()), offset
+
+        (units, tags, dmax, expires) = entry
+        if dmax:
+            if expires < now:
+                del(self.__meta[(hostname, metric_name)])
+                return (now, "ganglia", hostname, metric_name, value, "", ()), offset
+            entry[3] = now + dmax
+
+        return (now, "ganglia", hostname, metric_name, value, units, tags), offset
@@ -23,9 +23,27 @@
 #
 
 from wishbone import Actor
+from metricfactory.metric import MetricBatch, NAMES
+from gevent import spawn, sleep
 import re
 import sys
 
+# label=value[unit][;warn[;crit[;min[;max]]]]
+PERFDATA = re.compile(r"""
+    (?:'([^']*)'|([^\s'=]+))   # label, optionally quoted
+    =([-0-9.]+|U)               # value
+    ([^;\s]*)                   # unit
+    ;?([^;\s]*)                 # warn
+    ;?([^;\s]*)                 # crit
+    ;?([^;\s]*)                 # min
+    ;?([^;\s]*)                 # max
+    """, re.VERBOSE)
+
+NUMBER = re.compile("-?[0-9.]+$")
+
+HOSTCHECKCOMMAND = re.compile("(.*?)!\(?.*")
+SERVICECHECKCOMMAND = re.compile("((.*)(?=\!)|(.*))")
+
 
 class ModGearman(Actor):
 
@@ -59,6 +77,34 @@ class ModGearman(Actor):
            |  Might be practical when FQDN hostnames mess up the namespace
            |  such as Graphite.
 
+        - bulk(int)(0)
+           |  When > 0, the metrics of <bulk> spool lines are combined into
+           |  one event which holds a list of metrics instead of submitting
+           |  one event per metric.
+           |  0 disables bulk mode.
+
+        - bulk_interval(float)(1)
+           |  The max time in seconds to wait for <bulk> spool lines to
+           |  arrive before submitting the incomplete bulk.
+
+        - compact(bool)(False)
+           |  When True, a bulk is submitted as a MetricBatch instead of a
+           |  list of metrics.
+
+        - cache(int)(10000)
+           |  The max number of filtered metric names and check commands
+           |  to remember.
+
+        - thresholds(str)("")
+           |  What to do with the warn, crit, min and max values of the
+           |  performance data:
+           |    "": drop them.
+           |    "metrics": submit them as <metric>.warn, <metric>.crit,
+           |               <metric>.min and <metric>.max.  Ranges are
+           |               skipped since they aren't a single value.
+           |    "tags": add them as warn=<value>, crit=<value>, min=<value>
+           |            and max=<value> to the tags of the metric.
+
 
     Queues:
 
@@ -67,10 +113,26 @@ class ModGearman(Actor):
         - outbox:   Outgoing events in MetricFactory format.
     '''
 
-    def __init__(self, name, size=100, frequency=1, sanitize_hostname=False):
+    def __init__(self, name, size=100, frequency=1, sanitize_hostname=False, bulk=0, bulk_interval=1, compact=False, cache=10000, thresholds=""):
         Actor.__init__(self, name, size, frequency)
-        self.regex = re.compile('(.*?)(\D+)$')
+        if thresholds not in ("", "metrics", "tags"):
+            raise Exception("thresholds should be one of '', 'metrics' or 'tags'.")
+        self.thresholds = thresholds
         self.sanitize_hostname = sanitize_hostname
+        self.bulk = bulk
+        self.bulk_interval = float(bulk_interval)
+        self.compact = compact
+        if compact:
+            self.__newBulk = MetricBatch
+        else:
+            self.__newBulk = list
+        self.__bulk = self.__newBulk()
+        self.__bulk_header = {}
+        self.__bulk_lines = 0
+        self.cache = cache
+        self.__names = {}
+        self.__host_commands = {}
+        self.__service_commands = {}
         self.pool.createQueue("inbox")
         self.pool.createQueue("outbox")
         self.registerConsumer(self.consume, "inbox")
@@ -81,10 +143,15 @@ class ModGearman(Actor):
         else:
             self.replacePeriod = self.__doNoReplacePeriod
 
+        if self.bulk > 0:
+            self.submitMetrics = self.__doBulkSubmit
+            spawn(self.flushBulk)
+        else:
+            self.submitMetrics = self.__doSubmit
+
     def consume(self, event):
         try:
-            for metric in self.decodeMetrics(event["data"]):
-                self.submit({"header": event["header"], "data": metric}, self.pool.queue.outbox)
+            self.submitMetrics(event["header"], self.decodeMetrics(event["data"]))
         except Exception as err:
 
             self.logging.warn('Malformatted performance data received. Reason: %s Line: %s' % (err, sys.exc_traceback.tb_lineno))
@@ -96,27 +163,58 @@ class ModGearman(Actor):
         # DATATYPE::SERVICEPERFDATA TIMET::1411637603   HOSTNAME::hostname.localdomain SERVICEDESC::Postgres  SERVICEPERFDATA::time=0.02  'db1'=20;540;570;0;600 'db2'=0;540;570;0;600 'postgres'=1;540;570;0;600 'db3'=128;540;570;0;600 'db4'=42;540;570;0;600    SERVICECHECKCOMMAND::check:postgres.backends.status SERVICESTATE::0 SERVICESTATETYPE::1
 
         d = self.__chopStringDict(data)
-
-        for metric in re.findall('(\w*?\'*=\d*(?:\.\d*)?(?:s|us|ms|%|B|MB|KB|TB|c)?)', d["perfdata"]):
-            # name and value
-            (metric_name, metric_value) = metric.split('=')
-            metric_name = self.__filter(metric_name)
-
-            # metric time
-            metric_timet = d["timet"]
-
-            # metric unit
-            re_unit = re.search("\D+$", metric_value)
-            if re_unit is None:
-                metric_unit = ''
+        tags = NAMES.intern((d["type"], d["checkcommand"]))
+
+        for (metric_name, metric_value, metric_unit, warn, crit, minimum, maximum) in self.parsePerfData(d["perfdata"]):
+            metric_name = NAMES.intern("%s.%s" % (d["name"], metric_name))
+            metric_unit = NAMES.intern(metric_unit)
+            if self.thresholds == "tags":
+                threshold_tags = tuple("%s=%s" % (t, v) for (t, v) in (("warn", warn), ("crit", crit), ("min", minimum), ("max", maximum)) if v != "")
+                yield (d["timet"], "nagios", d["hostname"], metric_name, metric_value, metric_unit, tags + threshold_tags)
             else:
-                metric_unit = re_unit.group(0)
-            metric_value = metric_value.rstrip(metric_unit)
+                yield (d["timet"], "nagios", d["hostname"], metric_name, metric_value, metric_unit, tags)
+                if self.thresholds == "metrics":
+                    for (t, v) in (("warn", warn), ("crit", crit), ("min", minimum), ("max", maximum)):
+                        if NUMBER.match(v):
+                            yield (d["timet"], "nagios", d["hostname"], NAMES.intern("%s.%s" % (metric_name, t)), v, metric_unit, tags)
+
+    def parsePerfData(self, perfdata):
+        '''Parses a Nagios performance data string in one pass.
 
-            # tags
-            tags = [d["type"], d["checkcommand"]]
+        Yields (name, value, unit, warn, crit, min, max) for each metric with
+        a known value.  Name is filtered, missing fields are empty strings.
+        '''
 
-            yield (metric_timet, "nagios", d["hostname"], "%s.%s" % (d["name"], metric_name), metric_value, metric_unit, tuple(tags))
+        for (quoted, label, value, unit, warn, crit, minimum, maximum) in PERFDATA.findall(perfdata):
+            if value != "U":
+                yield (self.__filter(quoted or label), value, unit, warn, crit, minimum, maximum)
+
+    def flushBulk(self):
+        '''Submits the incomplete bulk every <bulk_interval> seconds.'''
+
+        while self.loop():
+            sleep(self.bulk_interval)
+            self.__submitBulk()
+
+    def __doSubmit(self, header, metrics):
+        for metric in metrics:
+            self.submit({"header": header, "data": metric}, self.pool.queue.outbox)
+
+    def __doBulkSubmit(self, header, metrics):
+        metrics = list(metrics)
+        if not self.__bulk:
+            self.__bulk_header = header
+        self.__bulk.extend(metrics)
+        self.__bulk_lines += 1
+        if self.__bulk_lines >= self.bulk:
+            self.__submitBulk()
+
+    def __submitBulk(self):
+        bulk = self.__bulk
+        self.__bulk = self.__newBulk()
+        self.__bulk_lines = 0
+        if bulk:
+            self.submit({"header": self.__bulk_header, "data": bulk}, self.pool.queue.outbox)
 
     def __chopStringDict(self, data):
         '''Returns a dictionary of the provided raw service/host check string.'''
@@ -137,18 +235,29 @@ class ModGearman(Actor):
         if "hostperfdata" in r:
             r["type"] = "hostcheck"
             r["perfdata"] = r["hostperfdata"]
-            r["checkcommand"] = re.search("(.*?)!\(?.*", r["hostcheckcommand"]).group(1)
+            r["checkcommand"] = self.__checkCommand(self.__host_commands, HOSTCHECKCOMMAND, r["hostcheckcommand"])
             r["name"] = "hostcheck"
         else:
             r["type"] = "servicecheck"
             r["perfdata"] = r["serviceperfdata"]
-            r["checkcommand"] = re.search("((.*)(?=\!)|(.*))", r["servicecheckcommand"]).group(1)
+            r["checkcommand"] = self.__checkCommand(self.__service_commands, SERVICECHECKCOMMAND, r["servicecheckcommand"])
             r["name"] = self.__filter(r["servicedesc"])
 
-        r["hostname"] = self.replacePeriod(self.__filter(r["hostname"]))
+        r["hostname"] = NAMES.intern(self.replacePeriod(self.__filter(r["hostname"])))
 
         return r
 
+    def __checkCommand(self, commands, regex, command):
+        '''Returns the check command name out of the command line.'''
+
+        try:
+            return commands[command]
+        except KeyError:
+            if len(commands) >= self.cache:
+                commands.clear()
+            commands[command] = regex.search(command).group(1)
+            return commands[command]
+
     def __filter(self, name):
         '''Filter out problematic characters.
 
@@ -156,13 +265,19 @@ class ModGearman(Actor):
         from a bootstrap file and most likely become a separate module.
         '''
 
-        name = name.replace("'", '')
-        name = name.replace('"', '')
-        name = name.replace('!(null)', '')
-        name = name.replace(" ", "_")
-        name = name.replace("/", "_")
-        name = name.replace(".", "_")
-        return name.lower()
+        try:
+            return self.__names[name]
+        except KeyError:
+            filtered = name.replace("'", '')
+            filtered = filtered.replace('"', '')
+            filtered = filtered.replace('!(null)', '')
+            filtered = filtered.replace(" ", "_")
+            filtered = filtered.replace("/", "_")
+            filtered = filtered.replace(".", "_")
+            if len(self.__names) >= self.cache:
+                self.__names.clear()
+            self.__names[name] = filtered.lower()
+            return self.__names[name]
 
     def __doReplacePeriod(self, data):
         return data.replace(".", "_")
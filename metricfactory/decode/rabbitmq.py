@@ -23,6 +23,7 @@
 #
 
 from wishbone import Actor
+from metricfactory.flatten import Flattener
 from gevent import monkey
 monkey.patch_time()
 from time import time
@@ -58,6 +59,20 @@ class RabbitMQ(Actor):
         - source(str)("rabbitmq")
            |  Allows to set the source manually.
 
+        - lists(str)("skip")
+           |  How to deal with lists:
+           |    "skip": ignore them.
+           |    "index": use the position of the items as metric name.
+
+        - strings(bool)(False)
+           |  When True, strings containing a number are converted to
+           |  numbers.
+
+        - plans(int)(10000)
+           |  The max number of crawl plans to keep.  One plan is kept per
+           |  queue (<vhost>.queue.<name>) and per exchange
+           |  (<vhost>.exchange.<name>).
+
 
     Queues:
 
@@ -67,10 +82,11 @@ class RabbitMQ(Actor):
 
     '''
 
-    def __init__(self, name, size=100, frequency=1, source="rabbitmq"):
+    def __init__(self, name, size=100, frequency=1, source="rabbitmq", lists="skip", strings=False, plans=10000):
         Actor.__init__(self, name, size, frequency)
         self.logging.info("Initialized")
         self.source = source
+        self.flattener = Flattener(plans=plans, lists=lists, strings=strings)
         self.pool.createQueue("inbox")
         self.pool.createQueue("outbox")
         self.registerConsumer(self.consume, "inbox")
@@ -122,16 +138,9 @@ class RabbitMQ(Actor):
                     yield metric
 
     def __formatMetric(self, timestamp, name, value):
-        return (timestamp, "elasticsearch", self.source, name, value, '', ())
+        return (timestamp, "rabbitmq", self.source, name, value, '', ())
 
-    def __crawlDictionary(self, timestamp, dictionary,  breadcrumbs=""):
+    def __crawlDictionary(self, timestamp, dictionary, breadcrumbs=""):
 
-        for k, v in dictionary.iteritems():
-            b = "%s.%s" % (breadcrumbs, k)
-            if isinstance(v, dict):
-                for metric in self.__crawlDictionary(timestamp, v, b):
-                    yield metric
-            elif isinstance(v, list):
-                continue
-            elif isinstance(v, (int, long, float, complex)):
-                yield self.__formatMetric(timestamp, b, v)
+        for (name, value) in self.flattener.flatten(dictionary, breadcrumbs):
+            yield self.__formatMetric(timestamp, name, value)
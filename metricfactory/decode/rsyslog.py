@@ -23,6 +23,7 @@
 #
 
 from wishbone import Actor
+from metricfactory.metric import NAMES
 from gevent import monkey;monkey.patch_time()
 from time import time
 import json
@@ -88,14 +89,13 @@ class Rsyslog(Actor):
         self.registerConsumer(self.consume, "inbox")
         self.logging.info("Initialized")
         self.source = source
-        self.prev_metric = {}
 
     def consume(self, event):
 
-        for metric in self.__extractMetrics(event["data"].rstrip()):
+        for metric in self.extractMetrics(event["data"].rstrip()):
             self.submit({"header": event["header"], "data": metric}, self.pool.queue.outbox)
 
-    def __extractMetrics(self, data):
+    def extractMetrics(self, data):
 
         try:
             (time, hostname, j) = re.match('(^\d*) (.*?) (.*)', data).groups()
@@ -112,7 +112,7 @@ class Rsyslog(Actor):
         keys.remove("name")
         name = self.__scrubMetricName(data["name"])
         for item in keys:
-            yield "%s.%s.%s.total" % (hostname, name, item.replace('.', '')), data[item]
+            yield NAMES.intern("%s.%s.%s.total" % (hostname, name, item.replace('.', ''))), data[item]
 
     def __scrubMetricName(self, name):
         for character in [")", "*", ":", "]", " "]:
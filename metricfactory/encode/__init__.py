@@ -22,4 +22,6 @@
 #
 #
 
-from graphite import Graphite
\ No newline at end of file
+from graphite import Graphite
+from graphitepickle import GraphitePickle
+from influxdb import InfluxDB
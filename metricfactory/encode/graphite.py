@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       graphite.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.metric import MetricBatch
+from gevent import spawn, sleep
+
+
+class Graphite(Actor):
+
+    '''**Encodes metrics into the Graphite plaintext format.**
+
+    Incoming metrics have following format:
+
+    (time, type, source, name, value, unit, (tag1, tag2))
+
+    and are converted into:
+
+    <prefix><source>.<name> <value> <time>
+
+    Metrics are buffered until flush_size metrics are collected or until
+    flush_interval seconds have passed.  The buffered metrics are then
+    rendered into one string using one format operation and submitted as
+    one event carrying the header of the first buffered event.
+
+    The data of an incoming event is either a single metric, a list of
+    metrics or a MetricBatch.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - prefix(str)("")
+           |  A string to prepend to each metric name.
+
+        - source(bool)(True)
+           |  When True, the source is included in the metric name.
+
+        - flush_size(int)(1)
+           |  The number of metrics to buffer before submitting them.
+
+        - flush_interval(float)(1)
+           |  The max time in seconds to buffer metrics.
+
+
+    Queues:
+
+        - inbox:    Incoming events.
+
+        - outbox:   Outgoing events.
+    '''
+
+    def __init__(self, name, size=100, frequency=1, prefix="", source=True, flush_size=1, flush_interval=1):
+        Actor.__init__(self, name, size, frequency)
+        self.name = name
+        self.prefix = prefix
+        self.source = source
+        self.flush_size = flush_size
+        self.flush_interval = float(flush_interval)
+        if source:
+            self.line = "%s%%s.%%s %%s %%d\n" % (prefix.replace("%", "%%"))
+        else:
+            self.line = "%s%%s %%s %%d\n" % (prefix.replace("%", "%%"))
+        self.__header = None
+        self.__values = []
+        self.__count = 0
+        self.pool.createQueue("inbox")
+        self.pool.createQueue("outbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def preHook(self):
+        if self.flush_size > 1:
+            spawn(self.flushTimer)
+
+    def consume(self, event):
+        if isinstance(event["data"], (list, MetricBatch)):
+            metrics = event["data"]
+        else:
+            metrics = (event["data"],)
+        if self.__header is None:
+            self.__header = event["header"]
+
+        # Decoders such as ModGearman and Rsyslog submit the time as a
+        # string.  Converting it here makes a bad metric fail this event
+        # only instead of the flush of the whole buffer.
+        values = []
+        extend = values.extend
+        if self.source:
+            for metric in metrics:
+                extend((metric[2], metric[3], metric[4], int(float(metric[0]))))
+        else:
+            for metric in metrics:
+                extend((metric[3], metric[4], int(float(metric[0]))))
+        self.__values.extend(values)
+        self.__count += len(metrics)
+
+        if self.__count >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        '''Submits the buffered metrics as one string.'''
+
+        if self.__count == 0:
+            return
+        data = (self.line * self.__count) % tuple(self.__values)
+        header = self.__header
+        self.__header = None
+        self.__values = []
+        self.__count = 0
+        self.submit({"header": header, "data": data}, self.pool.queue.outbox)
+
+    def flushTimer(self):
+        while self.loop():
+            sleep(self.flush_interval)
+            self.flush()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       influxdb.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.metric import MetricBatch
+from gevent import spawn, sleep
+
+PRECISION = {"s": 1, "ms": 1000, "u": 1000000, "ns": 1000000000}
+
+
+def escapeMeasurement(value):
+    return value.replace(",", "\\,").replace(" ", "\\ ")
+
+
+def escapeTag(value):
+    return value.replace(",", "\\,").replace("=", "\\=").replace(" ", "\\ ")
+
+
+class InfluxDB(Actor):
+
+    '''**Encodes metrics into the InfluxDB line protocol.**
+
+    Incoming metrics have following format:
+
+    (time, type, source, name, value, unit, (tag1, tag2))
+
+    and are converted into:
+
+    <prefix><name>,source=<source>,type=<type>,<tags> value=<value> <time>
+
+    Tags of the form "key=value" become Influx tags as such.  Other tags
+    are named after their position among the tags without "=" using
+    tag_names, or tag<position> when tag_names has no name for that
+    position.  The source
+    and type take precedence over tags with the same key.  Tags are sorted
+    by key and tags with an empty value are left out.
+
+    The escaped measurement and tag set are cached per series so they are
+    built only once per series.  Numbers and strings containing a number,
+    as submitted by ModGearman, are written as float fields.  Metrics with
+    a NaN or infinite value are skipped since Influx can't store them as
+    float.  Other values are written as string fields.  Times submitted as
+    strings are converted too.
+
+    Lines are buffered until flush_size lines are collected or until
+    flush_interval seconds have passed.  The buffered lines are then
+    submitted as one string carrying the header of the first buffered
+    event.
+
+    The data of an incoming event is either a single metric, a list of
+    metrics or a MetricBatch.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - prefix(str)("")
+           |  A string to prepend to each measurement.
+
+        - tag_names(list)([])
+           |  The tag keys of the tags which aren't of the form key=value
+           |  by their position among these tags.
+
+        - precision(str)("s")
+           |  The precision of the timestamps: "s", "ms", "u" or "ns".
+
+        - flush_size(int)(1000)
+           |  The number of lines to buffer before submitting them.
+
+        - flush_interval(float)(1)
+           |  The max time in seconds to buffer lines.
+
+        - cache(int)(100000)
+           |  The max number of series to cache.
+
+
+    Queues:
+
+        - inbox:    Incoming events.
+
+        - outbox:   Outgoing events.
+    '''
+
+    def __init__(self, name, size=100, frequency=1, prefix="", tag_names=[], precision="s", flush_size=1000, flush_interval=1, cache=100000):
+        Actor.__init__(self, name, size, frequency)
+        if precision not in PRECISION:
+            raise Exception("precision should be one of 's', 'ms', 'u' or 'ns'.")
+        self.name = name
+        self.prefix = prefix
+        self.tag_names = tag_names
+        self.precision = precision
+        self.multiplier = PRECISION[precision]
+        self.flush_size = flush_size
+        self.flush_interval = float(flush_interval)
+        self.cache = cache
+        self.__series = {}
+        self.__header = None
+        self.__lines = []
+        self.pool.createQueue("inbox")
+        self.pool.createQueue("outbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def preHook(self):
+        if self.flush_size > 1:
+            spawn(self.flushTimer)
+
+    def consume(self, event):
+        if isinstance(event["data"], (list, MetricBatch)):
+            metrics = event["data"]
+        else:
+            metrics = (event["data"],)
+        if self.__header is None:
+            self.__header = event["header"]
+
+        lines = []
+        append = lines.append
+        series = self.__series
+        multiplier = self.multiplier
+        skipped = 0
+        for metric in metrics:
+            tags = metric[6]
+            if tags.__class__ is not tuple:
+                tags = tuple(tags)
+            key = (metric[1], metric[2], metric[3], tags)
+            try:
+                prefix = series[key]
+            except KeyError:
+                prefix = self.__addSeries(key)
+            timestamp = float(metric[0]) * multiplier
+            value = self.__number(metric[4])
+            if value is None:
+                append('%s"%s" %d' % (prefix, str(metric[4]).replace("\\", "\\\\").replace('"', '\\"'), timestamp))
+            elif value - value != 0:
+                skipped += 1
+            else:
+                append("%s%r %d" % (prefix, value, timestamp))
+        if skipped:
+            self.logging.debug("Skipped %s metrics with a NaN or infinite value." % (skipped))
+        self.__lines.extend(lines)
+
+        if len(self.__lines) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        '''Submits the buffered lines as one string.'''
+
+        if not self.__lines:
+            return
+        (header, lines) = (self.__header, self.__lines)
+        self.__header = None
+        self.__lines = []
+        lines.append("")
+        self.submit({"header": header, "data": "\n".join(lines)}, self.pool.queue.outbox)
+
+    def flushTimer(self):
+        while self.loop():
+            sleep(self.flush_interval)
+            self.flush()
+
+    def __number(self, value):
+        '''Returns value as a float or None when it isn't a number.'''
+
+        if value.__class__ is bool:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+    def __addSeries(self, key):
+        '''Returns and caches the line up to the field value of a series.'''
+
+        (type, source, name, tags) = key
+        pairs = {}
+        position = 0
+        for tag in tags:
+            if "=" in tag:
+                (k, v) = tag.split("=", 1)
+            else:
+                if position < len(self.tag_names):
+                    (k, v) = (self.tag_names[position], tag)
+                else:
+                    (k, v) = ("tag%s" % (position), tag)
+                position += 1
+            pairs[k] = v
+        pairs["source"] = source
+        pairs["type"] = type
+
+        tagset = "".join(",%s=%s" % (escapeTag(k), escapeTag(v)) for (k, v) in sorted(pairs.iteritems()) if k != "" and v != "")
+        prefix = "%s%s value=" % (escapeMeasurement(self.prefix + name), tagset)
+        if len(self.__series) >= self.cache:
+            self.__series.clear()
+        self.__series[key] = prefix
+        return prefix
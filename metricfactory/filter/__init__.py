@@ -22,4 +22,5 @@
 #
 #
 
-from metricfilter import MetricFilter
\ No newline at end of file
+from metricfilter import MetricFilter
+from rate import Rate
@@ -23,40 +23,384 @@
 #
 
 from wishbone import Actor
+from metricfactory.metric import MetricBatch
+from metricfactory.flatten import literalPrefix
+from gevent import spawn, sleep
+from gevent.socket import gethostname
+from time import time
+import os
+import re
+import yaml
+
+ACTIONS = ("drop", "rename", "tag")
+GROUP_REFERENCE = re.compile(r"\\(?:(\d+)|g<(\w+)>)")
+FIELDS = ("name", "source", "type", "tag")
+
+
+def compilePattern(pattern, groups=False):
+    '''Returns a regex matching the complete value against pattern.
+
+    Patterns starting with "re:" are regexes, all others are globs.  When
+    groups is True each "*" of a glob is a capture group.
+    '''
+
+    if pattern.startswith("re:"):
+        return re.compile("(?:%s)\Z" % (pattern[3:]))
+    if groups:
+        star = "(.*)"
+    else:
+        star = ".*"
+    return re.compile("%s\Z" % (star.join(".".join(re.escape(part) for part in piece.split("?")) for piece in pattern.split("*"))))
+
+
+def literalSegments(pattern):
+    '''Returns the leading dot delimited segments of pattern without wildcards.'''
+
+    if pattern.startswith("re:"):
+        return []
+    prefix = literalPrefix(pattern)
+    segments = prefix.split(".")
+    if prefix != pattern:
+        segments.pop()
+    return segments
+
+
+class RuleSet(object):
+
+    '''**A compiled list of MetricFilter rules.**
+
+    Rules with a name pattern starting with literal segments are stored in
+    a trie of those segments.  Only the rules found along the path of the
+    metric name in the trie and the rules without literal segments are
+    evaluated for a metric, in their original order.
+
+    Parameters:
+
+        - rules(list)
+           |  The rules as defined in the MetricFilter docstring.
+    '''
+
+    def __init__(self, rules):
+        self.uses_type = False
+        self.uses_tags = False
+        self.__rules = []
+        self.__trie = ([], {})
+        for (index, rule) in enumerate(rules):
+            self.__add(index, rule)
+
+    def evaluate(self, source, name, type, tags):
+        '''Returns the new name and the tags to add or None to drop the metric.'''
+
+        (candidates, children) = self.__trie
+        candidates = list(candidates)
+        for segment in name.split("."):
+            try:
+                (rules, children) = children[segment]
+            except KeyError:
+                break
+            candidates.extend(rules)
+        candidates.sort()
+
+        added = ()
+        for index in candidates:
+            (patterns, action, argument) = self.__rules[index]
+            for (field, regex) in patterns:
+                if field == "name":
+                    match = name_match = regex.match(name)
+                elif field == "source":
+                    match = regex.match(source)
+                elif field == "type":
+                    match = regex.match(type)
+                else:
+                    match = self.__matchTags(regex, tags)
+                if match is None:
+                    break
+            else:
+                if action == "drop":
+                    return None
+                elif action == "rename":
+                    if patterns and patterns[0][0] == "name":
+                        return (name_match.expand(argument), added)
+                    return (argument, added)
+                else:
+                    added += argument
+        return (name, added)
+
+    def __add(self, index, rule):
+
+        if not isinstance(rule, dict):
+            raise Exception("Rule %s should be a dictionary." % (index))
+        actions = [action for action in ACTIONS if action in rule]
+        if len(actions) != 1:
+            raise Exception("Rule %s should have exactly one of %s." % (index, ", ".join(ACTIONS)))
+        action = actions[0]
+        match = rule.get("match", {})
+        if not isinstance(match, dict) or [field for field in match if field not in FIELDS]:
+            raise Exception("Rule %s should match on %s." % (index, ", ".join(FIELDS)))
+
+        patterns = []
+        for field in FIELDS:
+            if field in match:
+                try:
+                    patterns.append((field, compilePattern(str(match[field]), field == "name" and action == "rename")))
+                except re.error as err:
+                    raise Exception("Rule %s has an invalid %s regex.  Reason: %s" % (index, field, err))
+        self.uses_type = self.uses_type or "type" in match
+        self.uses_tags = self.uses_tags or "tag" in match
+
+        if action == "drop":
+            argument = None
+        elif action == "rename":
+            argument = str(rule["rename"])
+            self.__checkReferences(index, argument, patterns)
+        else:
+            argument = rule["tag"]
+            if not isinstance(argument, list):
+                argument = [argument]
+            argument = tuple(str(tag) for tag in argument)
+        self.__rules.append((patterns, action, argument))
+
+        node = self.__trie
+        if "name" in match:
+            for segment in literalSegments(str(match["name"])):
+                node = node[1].setdefault(segment, ([], {}))
+        node[0].append(index)
+
+    def __checkReferences(self, index, argument, patterns):
+        '''Raises when argument refers to groups the name pattern lacks.'''
+
+        references = GROUP_REFERENCE.findall(argument)
+        if not references:
+            return
+        if not patterns or patterns[0][0] != "name":
+            raise Exception("Rule %s refers to groups but has no name pattern." % (index))
+        regex = patterns[0][1]
+        for (number, group) in references:
+            reference = number or group
+            if reference.isdigit():
+                missing = int(reference) > regex.groups
+            else:
+                missing = reference not in regex.groupindex
+            if missing:
+                raise Exception("Rule %s refers to a group its name pattern doesn't have." % (index))
+
+    def __matchTags(self, regex, tags):
+        for tag in tags:
+            match = regex.match(tag)
+            if match is not None:
+                return match
+        return None
 
 
 class MetricFilter(Actor):
 
-    '''**MetricFilter is a MetricFactory filter to filter or rename metric names.***
+    '''**Drops, renames and tags metrics.**
 
     MetricFilter allows certain metrics to be dropped or metrics names to be
     rewritten in transit.  This can be practical when dealing with metrics coming
     from different sources.
 
-    metric = {  "type":string,
-                "time":time(),
-                "source":string,
-                "name":string,
-                "value":string,
-                "units":string,
-                "tags":list
-                }
+    (time, type, source, name, value, unit, (tag1, tag2))
+
+    Each rule matches on any combination of the name, source, type and tags
+    of a metric and has one action:
+
+        - match:
+            name: "hadoop.*.queue.*"
+            source: "hadoop*"
+          rename: "queues.\\1.\\2"
+
+        - match:
+            name: "re:cpu\\.\\d+\\.idle"
+          drop: true
+
+        - match:
+            tag: "type=float"
+          tag: ["team=ops"]
+
+    Patterns are globs unless they start with "re:", in which case they're
+    regexes.  A pattern has to match the complete value.  A tag pattern
+    matches when any of the tags matches.  A rule without match applies to
+    all metrics.
+
+    Rules are evaluated in order against the incoming metric.  The first
+    drop or rename rule which matches decides the fate of the metric.  Tag
+    rules add their tags and evaluation continues.  A rename refers to the
+    groups of the name pattern using \\1, \\2, ...  Each "*" of a glob is a
+    group.
+
+    Only the rules of which the literal leading segments of the name
+    pattern match the metric name are evaluated, so the number of rules
+    with such a name pattern barely affects the cost per metric.
+
+    The outcome of the rules is cached per source and name, extended with
+    the type and tags when the rules match on those.  The cache consists of
+    a recent and an older generation.  When the recent generation is full
+    it replaces the older one, which drops the least recently used
+    entries.  The number of cache hits and misses is submitted to the
+    metrics queue every frequency seconds.
+
+    When rules_file is set, the rules are read from that YAML file instead.
+    The file is checked for changes every reload seconds.  A changed file is
+    compiled in the background and replaces the current rules at once,
+    which clears the cache.  When the new rules fail to load the current
+    rules remain in use.  The duration of the last reload is submitted to
+    the metrics queue.
+
+    The data of an incoming event is either a single metric, a list of
+    metrics or a MetricBatch as produced by decoders running in bulk mode.
 
 
     Parameters:
 
-        - name (str):   The instance name when initiated.
-        - meta (bool):  When True, drops data with version 128
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - rules(list)([])
+           |  The list of rules.
+
+        - cache(int)(100000)
+           |  The max number of cached outcomes.
+
+        - rules_file(str)("")
+           |  The YAML file containing the list of rules.
+           |  Takes precedence over rules.
+
+        - reload(int)(5)
+           |  The interval in seconds to check rules_file for changes.
+
 
     Queues:
 
         - inbox:    Incoming events.
+
         - outbox:   Outgoing events.
     '''
 
-    def __init__(self, name):
-        Actor.__init__(self, name)
+    def __init__(self, name, size=100, frequency=1, rules=[], cache=100000, rules_file="", reload=5):
+        Actor.__init__(self, name, size, frequency)
         self.name = name
+        self.cache = max(cache, 2)
+        self.rules_file = rules_file
+        self.reload = reload
+        self.hits = 0
+        self.misses = 0
+        self.reload_time = 0
+        if rules_file:
+            self.__modified = self.__fileStatus()
+            rules = self.readRules()
+        self.setRules(RuleSet(rules))
+        self.pool.createQueue("inbox")
+        self.pool.createQueue("outbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def preHook(self):
+        spawn(self.emitMetrics)
+        if self.rules_file:
+            spawn(self.watchRules)
+
+    def consume(self, event):
+        if isinstance(event["data"], (list, MetricBatch)):
+            metrics = event["data"].__class__()
+            for metric in event["data"]:
+                metric = self.filter(metric)
+                if metric is not None:
+                    metrics.append(metric)
+            if metrics:
+                self.submit({"header": event["header"], "data": metrics}, self.pool.queue.outbox)
+        else:
+            metric = self.filter(event["data"])
+            if metric is not None:
+                event["data"] = metric
+                self.submit(event, self.pool.queue.outbox)
+
+    def emitMetrics(self):
+        hostname = gethostname()
+        while self.loop():
+            now = time()
+            for (name, value) in (("cache.hits", self.hits), ("cache.misses", self.misses), ("cache.size", len(self.__recent) + len(self.__older)), ("rules.reload_time", self.reload_time)):
+                self.submit({"header": {}, "data": (now, "wishbone", hostname, "module.%s.%s" % (self.name, name), value, "", ())}, self.pool.queue.metrics)
+            sleep(self.frequency)
+
+    def watchRules(self):
+        while self.loop():
+            sleep(self.reload)
+            modified = self.__fileStatus()
+            if modified is None or modified == self.__modified:
+                continue
+            self.__modified = modified
+            start = time()
+            try:
+                rules = RuleSet(self.readRules())
+            except Exception as err:
+                self.logging.error("Failed to reload %s.  Keeping the current rules.  Reason: %s" % (self.rules_file, err))
+                continue
+            self.setRules(rules)
+            self.reload_time = time() - start
+            self.logging.info("Reloaded %s in %.3f seconds." % (self.rules_file, self.reload_time))
+
+    def readRules(self):
+        '''Returns the list of rules stored in rules_file.'''
+
+        with open(self.rules_file) as f:
+            rules = yaml.safe_load(f)
+        if rules is None:
+            return []
+        if not isinstance(rules, list):
+            raise Exception("%s should contain a list of rules." % (self.rules_file))
+        return rules
+
+    def setRules(self, rules):
+        '''Replaces the current RuleSet by rules and clears the cache.'''
+
+        self.rules = rules
+        self.__recent = {}
+        self.__older = {}
+
+    def __fileStatus(self):
+        '''Returns the modification time and size of rules_file.'''
+
+        try:
+            status = os.stat(self.rules_file)
+        except OSError as err:
+            self.logging.warning("Failed to check %s.  Reason: %s" % (self.rules_file, err))
+            return None
+        return (status.st_mtime, status.st_size)
+
+    def filter(self, metric):
+        '''Returns the filtered metric or None when it's dropped.'''
+
+        if self.rules.uses_tags:
+            key = (metric[2], metric[3], metric[1], tuple(metric[6]))
+        elif self.rules.uses_type:
+            key = (metric[2], metric[3], metric[1])
+        else:
+            key = (metric[2], metric[3])
+
+        try:
+            decision = self.__recent[key]
+            self.hits += 1
+        except KeyError:
+            try:
+                decision = self.__older[key]
+                self.hits += 1
+            except KeyError:
+                decision = self.rules.evaluate(metric[2], metric[3], metric[1], metric[6])
+                self.misses += 1
+            if len(self.__recent) >= self.cache / 2:
+                self.__older = self.__recent
+                self.__recent = {}
+            self.__recent[key] = decision
 
-    def consume(self, doc):
-        pass
+        if decision is None:
+            return None
+        (name, tags) = decision
+        if name == metric[3] and not tags:
+            return metric
+        return (metric[0], metric[1], metric[2], name, metric[4], metric[5], tuple(metric[6]) + tags)
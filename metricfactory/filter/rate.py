@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       rate.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.metric import MetricBatch
+from metricfactory.flatten import compileGlobs
+from array import array
+
+
+class Rate(Actor):
+
+    '''**Converts counters into rates or deltas.**
+
+    Monotonically increasing counters such as the ones coming from Rsyslog,
+    RabbitMQ or Elasticsearch are converted into the change per second or
+    into the change since the previous value of the same series.  A series
+    is a unique source and name combination.
+
+    The first value of a series only initializes its state and isn't
+    submitted.  A value lower than the previous one is considered to be a
+    counter reset, in which case the change is the value itself.
+
+    The state of each series is stored in two arrays of floats.  A slot in
+    these arrays is looked up using the source and name of the metric.
+
+    The data of an incoming event is either a single metric, a list of
+    metrics or a MetricBatch.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - counters(list)(["*"])
+           |  Glob patterns of the metric names to treat as counters.
+           |  Other metrics are forwarded untouched.
+
+        - mode(str)("rate")
+           |  "rate": the change per second.
+           |  "delta": the change since the previous value.
+
+        - suffix(str)("")
+           |  A string to append to the name of converted metrics.
+
+        - keep(bool)(False)
+           |  When True, the original counter is forwarded too.
+
+        - series(int)(1000000)
+           |  The max number of series to keep state for.  When exceeded
+           |  all state is dropped.
+
+
+    Queues:
+
+        - inbox:    Incoming events.
+
+        - outbox:   Outgoing events.
+    '''
+
+    def __init__(self, name, size=100, frequency=1, counters=["*"], mode="rate", suffix="", keep=False, series=1000000):
+        Actor.__init__(self, name, size, frequency)
+        if mode not in ("rate", "delta"):
+            raise Exception("mode should be one of 'rate' or 'delta'.")
+        if not counters:
+            raise Exception("counters should contain at least one pattern.")
+        self.name = name
+        self.counters = compileGlobs(counters)
+        self.mode = mode
+        self.suffix = suffix
+        self.keep = keep
+        self.series = series
+        self.__reset()
+        self.pool.createQueue("inbox")
+        self.pool.createQueue("outbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def consume(self, event):
+        if isinstance(event["data"], (list, MetricBatch)):
+            metrics = event["data"].__class__()
+            for metric in event["data"]:
+                derived = self.derive(metric)
+                if self.keep or derived is metric:
+                    metrics.append(metric)
+                if derived is not None and derived is not metric:
+                    metrics.append(derived)
+            if metrics:
+                self.submit({"header": event["header"], "data": metrics}, self.pool.queue.outbox)
+        else:
+            derived = self.derive(event["data"])
+            if self.keep or derived is event["data"]:
+                self.submit(event, self.pool.queue.outbox)
+            if derived is not None and derived is not event["data"]:
+                self.submit({"header": event["header"], "data": derived}, self.pool.queue.outbox)
+
+    def derive(self, metric):
+        '''Returns the converted counter.
+
+        Returns metric itself when it isn't a counter and None when there's
+        nothing to submit yet.
+        '''
+
+        (timestamp, type, source, name, value, unit, tags) = metric
+        try:
+            slot = self.__slots[source][name]
+        except KeyError:
+            slot = self.__addSeries(source, name)
+
+        if slot < 0:
+            return metric
+
+        try:
+            timestamp = float(timestamp)
+            value = float(value)
+        except (TypeError, ValueError):
+            self.logging.debug("Metric %s.%s has a non numeric value or time." % (source, name))
+            return metric
+
+        previous = self.__times[slot]
+        if previous < 0:
+            self.__times[slot] = timestamp
+            self.__values[slot] = value
+            return None
+        elapsed = timestamp - previous
+        if elapsed <= 0:
+            return None
+        change = value - self.__values[slot]
+        if change < 0:
+            change = value
+        self.__times[slot] = timestamp
+        self.__values[slot] = value
+
+        if self.mode == "rate":
+            return (metric[0], type, source, self.__names[slot], change / elapsed, unit + "/s", tags)
+        else:
+            return (metric[0], type, source, self.__names[slot], change, unit, tags)
+
+    def __addSeries(self, source, name):
+        '''Returns the slot of a new series or -1 if it isn't a counter.'''
+
+        if self.__series >= self.series:
+            self.logging.warning("More than %s series.  Dropping the state of all series." % (self.series))
+            self.__reset()
+        self.__series += 1
+
+        if self.counters.match(name) is None:
+            slot = -1
+        else:
+            slot = len(self.__names)
+            self.__names.append(name + self.suffix)
+            self.__times.append(-1)
+            self.__values.append(0)
+        self.__slots.setdefault(source, {})[name] = slot
+        return slot
+
+    def __reset(self):
+        self.__series = 0
+        self.__slots = {}
+        self.__names = []
+        self.__times = array("d")
+        self.__values = array("d")
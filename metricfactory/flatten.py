@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       flatten.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from metricfactory.metric import NAMES
+import re
+
+NUMBERS = frozenset((int, long, float, complex))
+STRINGS = frozenset((str, unicode))
+NUMBER = re.compile(r"-?\d+(\.\d+)?([eE][-+]?\d+)?$")
+
+
+def compileGlobs(patterns):
+    '''Returns one regex matching any of the glob patterns.
+
+    "*" matches any sequence of characters including periods, "?" matches
+    any single character.  Returns None when there are no patterns.
+    '''
+
+    if not patterns:
+        return None
+    regexes = []
+    for pattern in patterns:
+        regexes.append(".*".join(".".join(re.escape(part) for part in piece.split("?")) for piece in pattern.split("*")))
+    return re.compile("(?:%s)\Z" % ("|".join(regexes)))
+
+
+def literalPrefix(pattern):
+    '''Returns the part of a glob pattern in front of the first wildcard.'''
+
+    return re.split("[*?]", pattern, 1)[0]
+
+
+class Flattener(object):
+
+    '''**Flattens nested dictionaries into point delimited metric names.**
+
+    The first time a dictionary is flattened under a certain name, a plan
+    is compiled out of its shape.  A plan is a flat list of the nested
+    dictionaries, their number of keys and the precomputed metric names of
+    their values.  Following dictionaries flattened under the same name are
+    read using the plan without walking them or formatting any names.
+
+    A plan is compiled again as soon as a dictionary turns out to have a
+    different shape.
+
+    Include and exclude patterns are globs matched against the complete
+    metric name.  Nested dictionaries which can't contain any included
+    metric or of which all metrics are excluded are left out of the plan
+    and never read.  The same goes for nested dictionaries of which none of
+    the values is included, so newly included values appearing in them are
+    only picked up once the plan gets compiled again.
+
+    Parameters:
+
+        - plans(int)(1000)
+           |  The max number of plans to keep.  When exceeded an arbitrary
+           |  plan is dropped.
+
+        - lists(str)("skip")
+           |  How to deal with lists:
+           |    "skip": ignore them.
+           |    "index": treat them as dictionaries keyed on the position
+           |             of the items.  a.b[0].c becomes a.b.0.c
+
+        - include(list)([])
+           |  Glob patterns of the metric names to include.
+           |  An empty list includes all metrics.
+
+        - exclude(list)([])
+           |  Glob patterns of the metric names to exclude.
+
+        - bools(bool)(True)
+           |  When True, booleans are converted to 1 and 0.
+           |  When False, booleans are skipped.
+
+        - strings(bool)(False)
+           |  When True, strings containing a number are converted to
+           |  numbers.
+    '''
+
+    def __init__(self, plans=1000, lists="skip", include=[], exclude=[], bools=True, strings=False):
+        if lists not in ("skip", "index"):
+            raise Exception("lists should be one of 'skip' or 'index'.")
+        self.plans = plans
+        self.lists = lists
+        self.bools = bools
+        self.strings = strings
+        self.include = compileGlobs(include)
+        self.include_prefixes = [literalPrefix(pattern) for pattern in include]
+        self.exclude = compileGlobs(exclude)
+        self.exclude_subtrees = compileGlobs([pattern for pattern in exclude if pattern.endswith("*")])
+        if lists == "index":
+            self.nested = (dict, list)
+        else:
+            self.nested = (dict,)
+        self.__plans = {}
+
+    def flatten(self, dictionary, breadcrumbs=""):
+        '''Returns a list of (name, value) for each number in dictionary.'''
+
+        try:
+            metrics = self.__extract(self.__plans[breadcrumbs], dictionary)
+            if metrics is not None:
+                return metrics
+        except KeyError:
+            pass
+
+        (plan, metrics) = self.__compile(dictionary, breadcrumbs)
+        if breadcrumbs not in self.__plans and len(self.__plans) >= self.plans:
+            self.__plans.popitem()
+        self.__plans[breadcrumbs] = plan
+        return metrics
+
+    def __compile(self, dictionary, breadcrumbs):
+        '''Walks dictionary and returns its plan and its metrics.
+
+        A plan is a list of (parent, key, type, length, leaves) in which
+        parent is the index of the parent dictionary or list in the plan and
+        leaves is a list of (key, name) of all included values which aren't
+        nested.
+        '''
+
+        plan = []
+        metrics = []
+        stack = [(-1, None, dictionary, "%s." % (breadcrumbs))]
+        while stack:
+            (parent, key, nested, prefix) = stack.pop()
+            if not self.__enter(prefix):
+                continue
+            index = len(plan)
+            leaves = []
+            plan.append((parent, key, nested.__class__, len(nested), leaves))
+            if nested.__class__ is dict:
+                items = nested.iteritems()
+            else:
+                items = enumerate(nested)
+            for k, v in items:
+                if isinstance(v, self.nested):
+                    stack.append((index, k, v, "%s%s." % (prefix, k)))
+                else:
+                    name = NAMES.intern("%s%s" % (prefix, k))
+                    if self.__included(name):
+                        leaves.append((k, name))
+                        value = self.__number(v)
+                        if value is not None:
+                            metrics.append((name, value))
+        return self.__prune(plan), metrics
+
+    def __prune(self, plan):
+        '''Returns plan without the nodes which have no leaves below them.
+
+        Empty dictionaries and the top level dictionary are kept so the plan
+        gets compiled again once they change.
+        '''
+
+        keep = [len(leaves) > 0 or length == 0 for (parent, key, kind, length, leaves) in plan]
+        if keep:
+            keep[0] = True
+        for index in xrange(len(plan) - 1, -1, -1):
+            if keep[index] and plan[index][0] >= 0:
+                keep[plan[index][0]] = True
+
+        positions = {-1: -1}
+        pruned = []
+        for (index, (parent, key, kind, length, leaves)) in enumerate(plan):
+            if keep[index]:
+                positions[index] = len(pruned)
+                pruned.append((positions[parent], key, kind, length, leaves))
+        return pruned
+
+    def __extract(self, plan, dictionary):
+        '''Returns the metrics of dictionary using plan.
+
+        Returns None when dictionary doesn't have the shape of plan.
+        '''
+
+        nested = self.nested
+        number = self.__number
+        parents = []
+        metrics = []
+        try:
+            for (parent, key, kind, length, leaves) in plan:
+                if parent >= 0:
+                    dictionary = parents[parent][key]
+                if dictionary.__class__ is not kind or len(dictionary) != length:
+                    return None
+                parents.append(dictionary)
+                for (k, name) in leaves:
+                    v = dictionary[k]
+                    if v.__class__ in NUMBERS:
+                        metrics.append((name, v))
+                    elif isinstance(v, nested):
+                        return None
+                    else:
+                        value = number(v)
+                        if value is not None:
+                            metrics.append((name, value))
+        except (KeyError, IndexError):
+            return None
+        return metrics
+
+    def __enter(self, prefix):
+        '''Returns True when the values below prefix can be included.'''
+
+        if self.exclude_subtrees is not None and self.exclude_subtrees.match(prefix):
+            return False
+        if self.include is None:
+            return True
+        for include_prefix in self.include_prefixes:
+            if include_prefix.startswith(prefix) or prefix.startswith(include_prefix):
+                return True
+        return False
+
+    def __included(self, name):
+        if self.exclude is not None and self.exclude.match(name):
+            return False
+        return self.include is None or self.include.match(name) is not None
+
+    def __number(self, value):
+        '''Returns value as a number or None when it isn't one.'''
+
+        if value.__class__ in NUMBERS:
+            return value
+        elif value.__class__ is bool:
+            if self.bools:
+                return int(value)
+        elif self.strings and value.__class__ in STRINGS:
+            match = NUMBER.match(value)
+            if match is not None:
+                if match.group(1) is None and match.group(2) is None:
+                    return int(value)
+                else:
+                    return float(value)
+        return None
@@ -23,3 +23,6 @@
 #
 
 from hammer import Hammer
+from replay import Replay
+from gmond import Gmond
+from internstats import InternStats
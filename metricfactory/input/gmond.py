@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       gmond.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from gevent import spawn, sleep
+from gevent.socket import wait_read, gethostname
+from time import time
+from struct import Struct
+import errno
+import os
+import socket
+
+LENGTH = Struct(">I")
+
+
+class Gmond(Actor):
+
+    '''**Receives gmond UDP traffic in batches.**
+
+    Listens for the XDR packets sent by gmond.  Every time the socket
+    becomes readable it is drained without blocking into one preallocated
+    buffer until it's empty, <batch> packets are read or the buffer is
+    full.  Each packet is stored behind its length as a 4 byte unsigned
+    big-endian integer so packet boundaries are kept.  The packets are then
+    submitted as one event, which copies the data only once per batch.  The
+    outbox is meant to be connected to the Ganglia decoder running in bulk
+    mode.
+
+    The number of received packets and batches and the number of packets
+    dropped by the kernel because the receive buffer of the socket was
+    full, as read from /proc/net/udp, are submitted to the metrics queue
+    every frequency seconds.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - address(str)("0.0.0.0")
+           |  The address to bind to.
+
+        - port(int)(8649)
+           |  The port to bind to.
+
+        - batch(int)(1000)
+           |  The max number of packets to submit as one event.
+
+        - buffer(int)(1048576)
+           |  The size in bytes of the buffer to drain the socket into.
+
+        - rcvbuf(int)(4194304)
+           |  The receive buffer size of the socket (SO_RCVBUF).  The
+           |  kernel caps it to net.core.rmem_max.
+
+
+    Queues:
+
+        - outbox
+           |  Outgoing messges
+
+    '''
+
+    MAX_PACKET = 65535
+
+    def __init__(self, name, size=100, frequency=1, address="0.0.0.0", port=8649, batch=1000, buffer=1048576, rcvbuf=4194304):
+        Actor.__init__(self, name, size, frequency)
+        self.name = name
+        self.address = address
+        self.port = port
+        self.batch = batch
+        self.buffer = max(buffer, self.MAX_PACKET + 1)
+        self.rcvbuf = rcvbuf
+        self.packets = 0
+        self.batches = 0
+        self.pool.createQueue("outbox")
+
+    def preHook(self):
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.rcvbuf)
+        rcvbuf = self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+        if rcvbuf < self.rcvbuf:
+            self.logging.warning("Receive buffer is %s bytes instead of %s.  Raise net.core.rmem_max to allow more." % (rcvbuf, self.rcvbuf))
+        self.socket.bind((self.address, self.port))
+        self.socket.setblocking(0)
+        self.logging.info("Listening on %s:%s." % (self.address, self.port))
+        spawn(self.drain)
+        spawn(self.emitMetrics)
+
+    def postHook(self):
+        self.socket.close()
+
+    def drain(self):
+        buffer = bytearray(self.buffer)
+        view = memoryview(buffer)
+        limit = len(buffer) - self.MAX_PACKET - LENGTH.size
+        fileno = self.socket.fileno()
+        receive = self.socket.recv_into
+
+        while self.loop():
+            wait_read(fileno)
+            offset = 0
+            packets = 0
+            while offset <= limit and packets < self.batch:
+                try:
+                    size = receive(view[offset + LENGTH.size:], self.MAX_PACKET)
+                except socket.error as err:
+                    if err.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                        self.logging.error("Failed to receive packet.  Reason: %s" % (err))
+                    break
+                LENGTH.pack_into(buffer, offset, size)
+                offset += LENGTH.size + size
+                packets += 1
+
+            if packets:
+                self.packets += packets
+                self.batches += 1
+                self.submit({"header": {}, "data": view[:offset].tobytes()}, self.pool.queue.outbox)
+
+    def emitMetrics(self):
+        hostname = gethostname()
+        while self.loop():
+            now = time()
+            (queued, drops) = self.readSocketStats()
+            for (name, value) in (("packets", self.packets), ("batches", self.batches), ("rx_queue", queued), ("drops", drops)):
+                if value is not None:
+                    self.submit({"header": {}, "data": (now, "wishbone", hostname, "module.%s.%s" % (self.name, name), value, "", ())}, self.pool.queue.metrics)
+            sleep(self.frequency)
+
+    def readSocketStats(self):
+        '''Returns the bytes queued in and the packets dropped by the socket.
+
+        Returns (None, None) when the socket isn't found in /proc/net/udp.
+        '''
+
+        inode = str(os.fstat(self.socket.fileno()).st_ino)
+        try:
+            with open("/proc/net/udp") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) > 12 and fields[9] == inode:
+                        return int(fields[4].split(":")[1], 16), int(fields[12])
+        except IOError:
+            pass
+        return None, None
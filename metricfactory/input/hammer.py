@@ -23,9 +23,13 @@
 #
 
 from wishbone import Actor
+from metricfactory.metric import NAMES
 from time import time
-from random import randint, choice
-import string
+from array import array
+from itertools import izip
+from bisect import bisect_right
+from random import random, sample
+import os
 from gevent import sleep
 from gevent.socket import gethostname
 from gevent import spawn
@@ -38,7 +42,7 @@ class Hammer(Actor):
 
     Generates random metrics events in internal format with the purpose of
     testing.  Metrics are generated in batches.  One batch is a list of
-    dictionaries.
+    metrics.
 
     (time, type, source, name, value, unit, (tag1, tag2))
 
@@ -48,6 +52,27 @@ class Hammer(Actor):
 
         hammer.set_0.metric_0 34534 1382173076
 
+    The metric names are computed once and the random values of a batch are
+    drawn at once from os.urandom().  In bulk mode each batch is submitted
+    as one event holding the list of metrics.
+
+    Profiles make the workload look more like production:
+
+        - popularity "zipf": each batch draws as many metrics as there are
+          series, picking the series with a Zipf distribution so a few
+          series are very frequent and most of them are rare.
+        - churn: the fraction of the series replaced by new ones in each
+          batch.  New series get the next unused metric number.
+        - values "counter": each series is a counter increasing by a
+          random amount between 0 and value per sample.  Replaced series
+          start again at 0.
+        - sources and tags: the series are spread over <sources> sources
+          (hammer-<n>) and <tags> tag variants (variant=<n>).
+
+    The header of each event contains the time the metric was generated
+    under the name of the module, {<name>: {"time": <time>}}, allowing to
+    measure the latency of a pipeline.
+
 
     Parameters:
 
@@ -79,6 +104,29 @@ class Hammer(Actor):
         - prefix(str)(hammer)
             |  The top level name.
 
+        - bulk(bool)(False)
+            |  When True, submits each batch as one event.
+
+        - popularity(str)("uniform")
+            |  "uniform": each batch contains each series once.
+            |  "zipf": series are picked with a Zipf distribution.
+
+        - zipf_exponent(float)(1.1)
+            |  The exponent of the Zipf distribution.
+
+        - churn(float)(0)
+            |  The fraction of the series replaced in each batch.
+
+        - values(str)("random")
+            |  "random": random values between 0 and value.
+            |  "counter": monotonically increasing values.
+
+        - sources(int)(1)
+            |  The number of sources to spread the series over.
+
+        - tags(int)(0)
+            |  The number of tag variants to spread the series over.
+
 
     Queues:
 
@@ -87,7 +135,7 @@ class Hammer(Actor):
 
     '''
 
-    def __init__(self, name, size=100, frequency=1, batch=0, batch_size=1, set_size=1, sleep=1, value=1, prefix='hammer'):
+    def __init__(self, name, size=100, frequency=1, batch=0, batch_size=1, set_size=1, sleep=1, value=1, prefix='hammer', bulk=False, popularity="uniform", zipf_exponent=1.1, churn=0, values="random", sources=1, tags=0):
         Actor.__init__(self, name, size, frequency)
         self.name = name
 
@@ -97,6 +145,36 @@ class Hammer(Actor):
         self.sleep_value = float(sleep)
         self.value = value
         self.prefix = prefix
+        self.bulk = bulk
+        if popularity not in ("uniform", "zipf"):
+            raise Exception("popularity should be one of 'uniform' or 'zipf'.")
+        if values not in ("random", "counter"):
+            raise Exception("values should be one of 'random' or 'counter'.")
+        self.popularity = popularity
+        self.zipf_exponent = zipf_exponent
+        self.churn = churn
+        self.values = values
+        self.sources = sources
+        self.tags = tags
+
+        self.names = []
+        self.series_sources = []
+        self.series_tags = []
+        for set_name in xrange(batch_size):
+            for metric_name in xrange(set_size):
+                self.series_sources.append(self.__source(len(self.names)))
+                self.series_tags.append(self.__tags(len(self.names)))
+                self.names.append(NAMES.intern('%s.set_%s.metric_%s' % (prefix, set_name, metric_name)))
+        self.counters = array("l", [0]) * len(self.names)
+        self.__next_metric = [set_size] * batch_size
+        self.__churned = 0.0
+
+        if popularity == "zipf":
+            total = 0
+            self.__weights = []
+            for rank in xrange(len(self.names)):
+                total += 1 / float(rank + 1) ** zipf_exponent
+                self.__weights.append(total)
 
         if batch == 0:
             self.generateNextBatchAllowed = self.__returnTrue
@@ -117,8 +195,12 @@ class Hammer(Actor):
         batch_counter = 0
         while self.loop():
             if self.generateNextBatchAllowed(batch_counter) is True:
-                for event in self.generateBatch():
-                    self.submit({"header": {}, "data": event}, self.pool.queue.outbox)
+                metrics = self.generateBatch()
+                if self.bulk:
+                    self.submit({"header": {self.name: {"time": metrics[0][0]}}, "data": metrics}, self.pool.queue.outbox)
+                else:
+                    for metric in metrics:
+                        self.submit({"header": {self.name: {"time": metric[0]}}, "data": metric}, self.pool.queue.outbox)
                 batch_counter += 1
             else:
                 self.logging.warn('Reached the batch_size of %s.  Not generating any further metrics.' % (self.batch_size))
@@ -129,10 +211,59 @@ class Hammer(Actor):
         # (time, type, source, name, value, unit, (tag1, tag2))
         # (1381002603.726132, 'wishbone', 'wishbone', 'queue.outbox.in_rate', 0, '', ())
         timestamp = time()
+        if self.churn > 0:
+            self.churnSeries()
+
+        if self.popularity == "uniform" and self.values == "random" and self.sources == 1 and self.tags == 0:
+            return [(timestamp, 'test', 'hammer', name, value, '', ()) for (name, value) in izip(self.names, self.randomValues(len(self.names)))]
 
-        for set_name in xrange(self.batch_size):
-            for metric_name in xrange(self.set_size):
-                yield (timestamp, 'test', 'hammer', '%s.set_%s.metric_%s' % (self.prefix, set_name, metric_name), randint(0, self.value), '', ())
+        if self.popularity == "zipf":
+            weights = self.__weights
+            total = weights[-1]
+            indices = [bisect_right(weights, random() * total) for i in xrange(len(self.names))]
+        else:
+            indices = xrange(len(self.names))
+        values = self.randomValues(len(indices))
+        if self.values == "counter":
+            counters = self.counters
+            for (position, index) in enumerate(indices):
+                counters[index] += values[position]
+                values[position] = counters[index]
+
+        names = self.names
+        sources = self.series_sources
+        tags = self.series_tags
+        return [(timestamp, 'test', sources[index], names[index], value, '', tags[index]) for (index, value) in izip(indices, values)]
+
+    def churnSeries(self):
+        '''Replaces churn of the series by new ones.'''
+
+        self.__churned += self.churn * len(self.names)
+        count = min(int(self.__churned), len(self.names))
+        self.__churned -= count
+        for index in sample(xrange(len(self.names)), count):
+            set_name = index // self.set_size
+            self.names[index] = NAMES.intern('%s.set_%s.metric_%s' % (self.prefix, set_name, self.__next_metric[set_name]))
+            self.__next_metric[set_name] += 1
+            self.counters[index] = 0
+
+    def randomValues(self, count):
+        '''Returns count random integers between 0 and value.'''
+
+        values = array("i")
+        values.fromstring(os.urandom(count * values.itemsize))
+        modulo = self.value + 1
+        return [(v & 0x7fffffff) % modulo for v in values]
+
+    def __source(self, number):
+        if self.sources <= 1:
+            return 'hammer'
+        return NAMES.intern('hammer-%s' % (number % self.sources))
+
+    def __tags(self, number):
+        if self.tags <= 0:
+            return ()
+        return NAMES.intern(('variant=%s' % (number % self.tags),))
 
     def __evaluateCounter(self, counter):
         if counter == self.batch:
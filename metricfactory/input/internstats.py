@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       internstats.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.metric import NAMES, SERIES
+from gevent import spawn, sleep
+from gevent.socket import gethostname
+from time import time
+
+
+class InternStats(Actor):
+
+    '''**Generates the statistics of the shared intern tables.**
+
+    Submits the statistics of the NAMES and SERIES intern tables shared by
+    all modules of the instance every interval seconds:
+
+    (time, "wishbone", hostname, "intern.<table>.<stat>", value, "", ())
+
+    in which table is "names" or "series" and stat is one of "size" (the
+    number of live values), "hits", "misses" and "clears".
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - interval(float)(10)
+           |  The time in seconds between two reports.
+
+
+    Queues:
+
+        - outbox
+           |  Outgoing messges
+
+    '''
+
+    def __init__(self, name, size=100, frequency=1, interval=10):
+        Actor.__init__(self, name, size, frequency)
+        self.name = name
+        self.interval = float(interval)
+        self.pool.createQueue("outbox")
+
+    def preHook(self):
+        spawn(self.generate)
+
+    def generate(self):
+        hostname = gethostname()
+        while self.loop():
+            self.submit({"header": {}, "data": self.generateMetrics(time(), hostname)}, self.pool.queue.outbox)
+            sleep(self.interval)
+
+    def generateMetrics(self, timestamp, hostname):
+        '''Returns the statistics of both tables as a list of metrics.'''
+
+        metrics = []
+        for (table, stats) in (("names", NAMES.stats()), ("series", SERIES.stats())):
+            for (stat, value) in sorted(stats.iteritems()):
+                metrics.append((timestamp, "wishbone", hostname, "intern.%s.%s" % (table, stat), value, "", ()))
+        return metrics
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       replay.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from gevent import spawn, sleep
+from struct import Struct
+from time import time
+import mmap
+
+RECORD = Struct(">dI")
+
+
+class Replay(Actor):
+
+    '''**Replays a capture file of raw payloads.**
+
+    Reads a capture file as written by the Capture output module and
+    submits each recorded payload as an event, so the traffic which reached
+    a decoder can be reproduced.  Each record consists of the time the
+    payload was captured as a double and the length of the payload as an
+    unsigned int, both big-endian, followed by the payload itself.
+
+    The file is memory mapped so only the part being replayed is loaded.
+
+    The payloads are replayed with the intervals they were captured with,
+    divided by speed.  A speed of 0 replays them as fast as possible.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - path(str)
+           |  The capture file to replay.
+
+        - speed(float)(1)
+           |  1 replays at the original speed, N at N times the original
+           |  speed and 0 as fast as possible.
+
+        - repeat(bool)(False)
+           |  When True, starts over once the end of the file is reached.
+
+
+    Queues:
+
+        - outbox
+           |  Outgoing messges
+
+    '''
+
+    def __init__(self, name, size=100, frequency=1, path=None, speed=1, repeat=False):
+        Actor.__init__(self, name, size, frequency)
+        if path is None:
+            raise Exception("path should be a capture file.")
+        self.name = name
+        self.path = path
+        self.speed = float(speed)
+        self.repeat = repeat
+        self.pool.createQueue("outbox")
+
+    def preHook(self):
+        spawn(self.replay)
+
+    def replay(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError, mmap.error) as err:
+            self.logging.error("Failed to open capture file %s.  Reason: %s" % (self.path, err))
+            return
+
+        try:
+            while self.loop():
+                replayed = self.replayFile(data)
+                self.logging.info("Replayed %s payloads from %s." % (replayed, self.path))
+                if not self.repeat or replayed == 0:
+                    break
+        finally:
+            data.close()
+
+    def replayFile(self, data):
+        '''Submits the payloads of data and returns the number of payloads.'''
+
+        length = len(data)
+        offset = 0
+        count = 0
+        first = None
+        start = time()
+        while offset < length and self.loop():
+            if offset + RECORD.size > length:
+                self.logging.warning("Capture file %s is truncated at offset %s." % (self.path, offset))
+                break
+            (timestamp, size) = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+            if offset + size > length:
+                self.logging.warning("Capture file %s is truncated at offset %s." % (self.path, offset))
+                break
+
+            if self.speed > 0:
+                if first is None:
+                    first = timestamp
+                delay = (timestamp - first) / self.speed - (time() - start)
+                if delay > 0:
+                    sleep(delay)
+            elif count % 1000 == 0:
+                sleep()
+
+            self.submit({"header": {}, "data": data[offset:offset + size]}, self.pool.queue.outbox)
+            offset += size
+            count += 1
+        return count
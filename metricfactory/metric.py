@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       metric.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from array import array
+from itertools import izip
+
+
+class InternTable(object):
+
+    '''**A bounded table returning one shared object per distinct value.**
+
+    Interning the names, sources and units built by the decoders makes
+    repeated values share one object, which saves memory and lets dict
+    lookups further down the pipeline succeed on identity.  Unlike the
+    builtin intern() it accepts unicode and tuples and is bounded.  A str
+    and unicode which compare equal are kept apart.  The table is cleared
+    once it holds size values.
+
+    The statistics of the shared NAMES and SERIES tables are reported by
+    the InternStats input module.
+
+    Parameters:
+
+        - size(int)(1000000)
+           |  The max number of values to keep.
+    '''
+
+    def __init__(self, size=1000000):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.clears = 0
+        self.__values = {}
+        self.__unicode = {}
+
+    def __len__(self):
+        return len(self.__values) + len(self.__unicode)
+
+    def intern(self, value):
+        '''Returns the shared object equal to value.'''
+
+        if value.__class__ is unicode:
+            table = self.__unicode
+        else:
+            table = self.__values
+        try:
+            value = table[value]
+            self.hits += 1
+            return value
+        except KeyError:
+            self.misses += 1
+            if len(self) >= self.size:
+                self.__values.clear()
+                self.__unicode.clear()
+                self.clears += 1
+            table[value] = value
+            return value
+
+    def stats(self):
+        '''Returns the number of live values, hits, misses and clears.'''
+
+        return {"size": len(self), "hits": self.hits, "misses": self.misses, "clears": self.clears}
+
+NAMES = InternTable()
+SERIES = InternTable()
+
+
+def series(type, source, name, unit, tags):
+    '''Returns the canonical (type, source, name, unit, tags) tuple.
+
+    Batches holding the same series share one tuple.
+    '''
+
+    return SERIES.intern((type, source, name, unit, tags))
+
+
+class MetricBatch(object):
+
+    '''**A compact list of metrics.**
+
+    Holds the times and values of a list of metrics in arrays of floats and
+    a reference to the canonical series tuple of each metric, instead of one
+    tuple per metric.  Values which aren't numbers are kept aside.
+
+    Iterating over a batch yields the metrics in the usual format:
+
+    (time, type, source, name, value, unit, (tag1, tag2))
+
+    Modules receiving events of which the data is a MetricBatch treat it as
+    a list of metrics.
+    '''
+
+    __slots__ = ("times", "values", "series", "others")
+
+    def __init__(self, metrics=()):
+        self.times = array("d")
+        self.values = array("d")
+        self.series = []
+        self.others = {}
+        self.extend(metrics)
+
+    def __len__(self):
+        return len(self.times)
+
+    def __iter__(self):
+        others = self.others
+        index = 0
+        for (time, value, (type, source, name, unit, tags)) in izip(self.times, self.values, self.series):
+            if others and index in others:
+                value = others[index]
+            yield (time, type, source, name, value, unit, tags)
+            index += 1
+
+    def append(self, metric):
+        '''Adds a metric in the usual tuple format.'''
+
+        (time, type, source, name, value, unit, tags) = metric
+        if tags.__class__ is not tuple:
+            tags = tuple(tags)
+        self.add(float(time), series(type, source, name, unit, tags), value)
+
+    def add(self, time, key, value):
+        '''Adds a metric using the canonical series tuple key.'''
+
+        try:
+            self.values.append(value)
+        except TypeError:
+            try:
+                self.values.append(float(value))
+            except (TypeError, ValueError):
+                self.values.append(0)
+                self.others[len(self.times)] = value
+        self.times.append(time)
+        self.series.append(key)
+
+    def extend(self, metrics):
+        for metric in metrics:
+            self.append(metric)
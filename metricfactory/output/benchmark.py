@@ -0,0 +1,167 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       benchmark.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.metric import MetricBatch
+from array import array
+from random import randint
+from resource import getrusage, RUSAGE_SELF
+from time import time
+import json
+import os
+import signal
+import sys
+
+
+class Benchmark(Actor):
+
+    '''**Consumes events and reports the throughput and latency.**
+
+    Counts the incoming events and metrics and measures the latency of each
+    event using the time stored in its header by the Hammer input module.
+    Once the expected number of events is consumed, a JSON summary is
+    printed and the process is interrupted with SIGINT so the pipeline
+    stops.  With events set to 0 the summary is printed when the module
+    stops.
+
+    The summary contains the events/s, metrics/s, the p50 and p99 latency
+    in seconds and the peak RSS in KB.  An event holding a list of metrics
+    or a MetricBatch counts for its number of metrics and an event holding
+    encoded data counts for its number of lines.
+
+    Latencies are sampled into a reservoir of <samples> values.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - events(int)(0)
+           |  The number of events to consume before stopping.
+           |  0 is unlimited.
+
+        - header(str)("hammer")
+           |  The header key holding the time the event was generated.
+
+        - samples(int)(1000000)
+           |  The max number of latencies to keep.
+
+        - summary(str)("")
+           |  A file to write the summary to on top of printing it.
+
+
+    Queues:
+
+        - inbox:    Incoming events.
+    '''
+
+    def __init__(self, name, size=100, frequency=1, events=0, header="hammer", samples=1000000, summary=""):
+        Actor.__init__(self, name, size, frequency)
+        self.name = name
+        self.events = events
+        self.header = header
+        self.samples = samples
+        self.summary = summary
+        self.__count = 0
+        self.__metrics = 0
+        self.__latencies = array("d")
+        self.__start = None
+        self.__end = None
+        self.__reported = False
+        self.pool.createQueue("inbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def consume(self, event):
+        now = time()
+        if self.__start is None:
+            self.__start = now
+        self.__end = now
+        self.__count += 1
+
+        data = event["data"]
+        if isinstance(data, (list, MetricBatch)):
+            self.__metrics += len(data)
+        elif isinstance(data, basestring):
+            self.__metrics += data.count("\n")
+        else:
+            self.__metrics += 1
+
+        try:
+            latency = now - event["header"][self.header]["time"]
+        except (KeyError, TypeError):
+            pass
+        else:
+            if len(self.__latencies) < self.samples:
+                self.__latencies.append(latency)
+            else:
+                index = randint(0, self.__count - 1)
+                if index < self.samples:
+                    self.__latencies[index] = latency
+
+        if self.__count == self.events:
+            self.report()
+            os.kill(os.getpid(), signal.SIGINT)
+
+    def postHook(self):
+        self.report()
+
+    def report(self):
+        '''Prints the summary once.'''
+
+        if self.__reported:
+            return
+        self.__reported = True
+
+        if self.__start is not None and self.__end > self.__start:
+            elapsed = self.__end - self.__start
+        else:
+            elapsed = 0
+        latencies = sorted(self.__latencies)
+        summary = {"events": self.__count,
+                   "metrics": self.__metrics,
+                   "seconds": elapsed,
+                   "events_per_second": self.__count / elapsed if elapsed else 0,
+                   "metrics_per_second": self.__metrics / elapsed if elapsed else 0,
+                   "latency_p50": self.__percentile(latencies, 50),
+                   "latency_p99": self.__percentile(latencies, 99),
+                   "max_rss_kb": getrusage(RUSAGE_SELF).ru_maxrss}
+
+        result = json.dumps(summary, sort_keys=True)
+        sys.stdout.write("%s\n" % (result))
+        sys.stdout.flush()
+        if self.summary:
+            with open(self.summary, "w") as f:
+                f.write("%s\n" % (result))
+        self.logging.info("Consumed %s events in %.2f seconds." % (self.__count, elapsed))
+
+    def __percentile(self, latencies, percentile):
+        if not latencies:
+            return None
+        return latencies[max(0, (len(latencies) * percentile + 99) // 100 - 1)]
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+#       capture.py
+#
+#       Copyright 2014 Jelle Smet development@smetj.net
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 3 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+#
+#
+
+from wishbone import Actor
+from metricfactory.input.replay import RECORD
+from time import time
+
+
+class Capture(Actor):
+
+    '''**Writes the raw payload of incoming events to a capture file.**
+
+    Each payload is stored with the time it was received so it can be
+    replayed later by the Replay input module.  Each record consists of
+    the time as a double and the length of the payload as an unsigned int,
+    both big-endian, followed by the payload itself.
+
+    Payloads which are unicode are stored UTF-8 encoded.
+
+    Parameters:
+
+        - name(str)
+           |  The name of the module.
+
+        - size(int)
+           |  The default max length of each queue.
+
+        - frequency(int)
+           |  The frequency in seconds to generate metrics.
+
+        - path(str)
+           |  The capture file to write.  Existing content is kept.
+
+
+    Queues:
+
+        - inbox:    Incoming events.
+    '''
+
+    def __init__(self, name, size=100, frequency=1, path=None):
+        Actor.__init__(self, name, size, frequency)
+        if path is None:
+            raise Exception("path should be a capture file.")
+        self.name = name
+        self.path = path
+        self.file = open(path, "ab")
+        self.pool.createQueue("inbox")
+        self.registerConsumer(self.consume, "inbox")
+
+    def consume(self, event):
+        data = event["data"]
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        elif not isinstance(data, str):
+            raise Exception("Only raw payloads can be captured, not %s." % (type(data).__name__))
+        self.file.write(RECORD.pack(time(), len(data)))
+        self.file.write(data)
+
+    def postHook(self):
+        self.file.close()
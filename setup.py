@@ -80,6 +80,9 @@ setup(
     entry_points={
         'console_scripts': ['metricfactory = metricfactory.main:main'],
         'metricfactory.encode': [
+            "graphite = metricfactory.encode:Graphite",
+            "graphitepickle = metricfactory.encode:GraphitePickle",
+            "influxdb = metricfactory.encode:InfluxDB"
         ],
         'metricfactory.decode': [
             "modgearman = metricfactory.decode:ModGearman",
@@ -89,10 +92,18 @@ setup(
             "rsyslog = metricfactory.decode:Rsyslog"
         ],
         'metricfactory.filter': [
-            "metricfilter = metricfactory.filter:MetricFilter"
+            "metricfilter = metricfactory.filter:MetricFilter",
+            "rate = metricfactory.filter:Rate"
         ],
         'metricfactory.input': [
-            "hammer = metricfactory.input:Hammer"
+            "hammer = metricfactory.input:Hammer",
+            "replay = metricfactory.input:Replay",
+            "gmond = metricfactory.input:Gmond",
+            "internstats = metricfactory.input:InternStats"
+        ],
+        'metricfactory.output': [
+            "benchmark = metricfactory.output:Benchmark",
+            "capture = metricfactory.output:Capture"
         ]
     }
 )